@@ -0,0 +1,98 @@
+"""
+You must have an AWS account to use the Amazon Connect CTI Adapter.
+Downloading and/or using the Amazon Connect CTI Adapter is subject to the terms of the AWS Customer Agreement,
+AWS Service Terms, and AWS Privacy Notice.
+
+© 2017, Amazon Web Services, Inc. or its affiliates. All rights reserved.
+
+NOTE:  Other license terms may apply to certain, identified software components
+contained within or distributed with the Amazon Connect CTI Adapter if such terms are
+included in the LibPhoneNumber-js and Salesforce Open CTI. For such identified components,
+such other license terms will then apply in lieu of the terms above.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+# Compares the per-contact latency of Salesforce writes made through the sfInvokeAPI Lambda (SF_INVOKE_API_MODE=invoke)
+# with writes made in process (SF_INVOKE_API_MODE=direct).
+#
+# Each contact replays the requests of the post-call functions: create the AC_ContactChannelAnalytics__c record,
+# update it with analysis results and attach both transcripts. Records are deleted afterwards.
+#
+# Run against a deployed stack with the environment of a post-call function, for example:
+#     SFDC_INVOKE_API_LAMBDA=<sfInvokeAPI ARN> SF_HOST=... SF_PRODUCTION=... SF_USERNAME=... SF_VERSION=... \
+#     SF_CREDENTIALS_SECRETS_MANAGER_ARN=... SF_ADAPTER_NAMESPACE=amazonconnect AMAZON_CONNECT_INSTANCE_ID=... \
+#     AMAZON_CONNECT_INSTANCE_REGION=... python benchmark_invoke_api.py --contacts 20
+
+import argparse
+import os
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lambda_functions'))
+
+import sf_util
+from sf_util import invokeSfAPI, attachFileSaleforceObject, getBase64String
+
+def namespace_prefix():
+    pnamespace = os.environ['SF_ADAPTER_NAMESPACE']
+    return '' if not pnamespace or pnamespace == '-' else pnamespace + '__'
+
+def sf_request(operation, **parameters):
+    return {'Details': {'Parameters': dict(parameters, sf_operation=operation)}}
+
+def process_contact(transcript):
+    pnamespace = namespace_prefix()
+    sf_object = pnamespace + 'AC_ContactChannelAnalytics__c'
+    started = time.time()
+    record_id = invokeSfAPI(sf_request('create', sf_object=sf_object, **{
+        pnamespace + 'ContactId__c': str(uuid.uuid4()),
+        pnamespace + 'InstanceId__c': os.environ['AMAZON_CONNECT_INSTANCE_ID'],
+        pnamespace + 'Region__c': os.environ['AMAZON_CONNECT_INSTANCE_REGION']
+    }))['Id']
+    invokeSfAPI(sf_request('update', sf_object=sf_object, sf_id=record_id, **{
+        pnamespace + 'Sentiment__c': 'POSITIVE, 0.9',
+        pnamespace + 'Keywords__c': 'benchmark, latency'
+    }))
+    attachFileSaleforceObject('CustomerTranscripts.json', 'application/json', 'Benchmark - Customer Side', record_id, getBase64String(transcript))
+    attachFileSaleforceObject('AgentTranscripts.json', 'application/json', 'Benchmark - Agent Side', record_id, getBase64String(transcript))
+    latency = time.time() - started
+    invokeSfAPI(sf_request('delete', sf_object=sf_object, sf_id=record_id))
+    return latency
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+def run(mode, contacts, transcript):
+    sf_util.SF_INVOKE_API_MODE = mode
+    # first contact warms up the client (and the sfInvokeAPI container), it is not measured
+    process_contact(transcript)
+    latencies = [process_contact(transcript) for _ in range(contacts)]
+    print('%-7s contacts=%d p50=%.0fms p95=%.0fms max=%.0fms' % (mode, contacts,
+        percentile(latencies, 0.5) * 1000, percentile(latencies, 0.95) * 1000, max(latencies) * 1000))
+
+def main():
+    parser = argparse.ArgumentParser(description='Compares the per-contact latency of the invoke and direct SF_INVOKE_API_MODE.')
+    parser.add_argument('--contacts', type=int, default=20)
+    parser.add_argument('--segments', type=int, default=200, help='transcript segments attached per side')
+    parser.add_argument('--modes', default='invoke,direct')
+    args = parser.parse_args()
+
+    transcript = [{'start_time': i * 2.0, 'end_time': i * 2.0 + 1.5, 'content': 'benchmark transcript segment %d.' % i} for i in range(args.segments)]
+    for mode in args.modes.split(','):
+        run(mode, args.contacts, transcript)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+"""
+You must have an AWS account to use the Amazon Connect CTI Adapter.
+Downloading and/or using the Amazon Connect CTI Adapter is subject to the terms of the AWS Customer Agreement,
+AWS Service Terms, and AWS Privacy Notice.
+
+© 2017, Amazon Web Services, Inc. or its affiliates. All rights reserved.
+
+NOTE:  Other license terms may apply to certain, identified software components
+contained within or distributed with the Amazon Connect CTI Adapter if such terms are
+included in the LibPhoneNumber-js and Salesforce Open CTI. For such identified components,
+such other license terms will then apply in lieu of the terms above.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+# Compares peak memory and CPU time of parsing a Transcribe output with json.load followed by processTranscript
+# per channel, against processTranscriptStream which reads the items from the stream.
+#
+# The transcript is generated, --items words per channel, about 10000 words per channel for an hour-long call:
+#     python benchmark_transcript_parser.py --items 10000
+
+import argparse
+import io
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lambda_functions'))
+os.environ.setdefault('SF_ADAPTER_NAMESPACE', '-')
+
+from sfComprehendUtil import processTranscript, processTranscriptStream
+
+WORDS = ['hello', 'thank', 'you', 'for', 'calling', 'my', 'account', 'number', 'is', 'please', 'hold', 'café', '"quoted"']
+
+def generate_transcript(items_per_channel, seed=0):
+    rng = random.Random(seed)
+    channels = []
+    words = []
+    for channel in range(2):
+        items = []
+        start_time = 0.0
+        for _ in range(items_per_channel):
+            start_time += rng.uniform(0.2, 1.5)
+            word = rng.choice(WORDS)
+            words.append(word)
+            items.append({
+                'start_time': '%.2f' % start_time,
+                'end_time': '%.2f' % (start_time + 0.3),
+                'alternatives': [{'confidence': '%.4f' % rng.uniform(0.5, 1.0), 'content': word}],
+                'type': 'pronunciation'
+            })
+            if rng.random() < 0.1:
+                items.append({'alternatives': [{'confidence': '0.0', 'content': rng.choice('.,?')}], 'type': 'punctuation'})
+        channels.append({'channel_label': 'ch_%d' % channel, 'items': items})
+    document = {
+        'jobName': 'benchmark',
+        'accountId': '123456789012',
+        'results': {
+            'transcripts': [{'transcript': ' '.join(words)}],
+            'channel_labels': {'channels': channels, 'number_of_channels': 2},
+            'items': [item for channel in channels for item in channel['items']]
+        },
+        'status': 'COMPLETED'
+    }
+    return json.dumps(document).encode('utf-8')
+
+def parse_loaded(body):
+    transcriptObj = json.load(io.BytesIO(body))
+    return {index: processTranscript(channel['items']) for index, channel in enumerate(transcriptObj['results']['channel_labels']['channels'])}
+
+def parse_streamed(body):
+    return processTranscriptStream(io.BytesIO(body))
+
+def measure(parse, body):
+    tracemalloc.start()
+    started = time.process_time()
+    result = parse(body)
+    elapsed = time.process_time() - started
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+def main():
+    parser = argparse.ArgumentParser(description='Compares json.load and streaming parsing of a Transcribe output.')
+    parser.add_argument('--items', type=int, default=10000, help='words per channel')
+    args = parser.parse_args()
+
+    body = generate_transcript(args.items)
+    print('transcript: %.1f MB, %d words per channel' % (len(body) / 1e6, args.items))
+    loaded, loaded_time, loaded_peak = measure(parse_loaded, body)
+    streamed, streamed_time, streamed_peak = measure(parse_streamed, body)
+    if loaded != streamed:
+        raise AssertionError('streamed segments differ from json.load segments')
+    # the S3 body is streamed in production, the in-memory test body is not counted
+    print('json.load  cpu=%.2fs peak=%.1f MB' % (loaded_time, loaded_peak / 1e6))
+    print('streamed   cpu=%.2fs peak=%.1f MB' % (streamed_time, streamed_peak / 1e6))
+
+if __name__ == '__main__':
+    main()
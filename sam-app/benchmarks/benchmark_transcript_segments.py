@@ -0,0 +1,135 @@
+"""
+You must have an AWS account to use the Amazon Connect CTI Adapter.
+Downloading and/or using the Amazon Connect CTI Adapter is subject to the terms of the AWS Customer Agreement,
+AWS Service Terms, and AWS Privacy Notice.
+
+© 2017, Amazon Web Services, Inc. or its affiliates. All rights reserved.
+
+NOTE:  Other license terms may apply to certain, identified software components
+contained within or distributed with the Amazon Connect CTI Adapter if such terms are
+included in the LibPhoneNumber-js and Salesforce Open CTI. For such identified components,
+such other license terms will then apply in lieu of the terms above.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+# Compares CPU time and memory of building Transcribe segments as dicts, the previous representation, with
+# TranscriptSegments, and the time to write the attachment JSON of each:
+#     python benchmark_transcript_segments.py --items 10000
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lambda_functions'))
+os.environ.setdefault('SF_ADAPTER_NAMESPACE', '-')
+
+from sfComprehendUtil import processTranscript
+
+WORDS = ['hello', 'thank', 'you', 'for', 'calling', 'my', 'account', 'number', 'is', 'please', 'hold', 'café']
+
+def dict_process_transcript(iItems):
+    # previous sfComprehendUtil.processTranscript
+    transcripts = []
+    for iTranscript in iItems:
+        transcript = {}
+        if 'start_time' not in iTranscript:
+            if iTranscript['type'] == 'punctuation':
+                if len(transcripts) > 0:
+                    lastItem = transcripts[len(transcripts)-1]
+                    lastChar = lastItem['content'][len(lastItem['content'])-1]
+                    if(lastChar != '.' and lastChar != ',' and lastChar != '?' and lastChar != ':' and lastChar != '!'):
+                        lastItem['content'] += iTranscript['alternatives'][0]['content']
+                        continue
+            continue
+        transcript['start_time'] = float(iTranscript['start_time'])
+        transcript['end_time'] = float(iTranscript['end_time'])
+        maxAlternativeConfidenceScore = 0.0
+        selectedAlternative = ''
+        for alternative in iTranscript['alternatives']:
+            if(float(alternative['confidence']) > maxAlternativeConfidenceScore):
+                selectedAlternative = alternative['content']
+                maxAlternativeConfidenceScore = alternative['confidence']
+        if(len(selectedAlternative) == 0):
+            continue
+        transcript['content'] = selectedAlternative
+        if(len(transcripts)>0):
+            lastItem = transcripts[len(transcripts)-1]
+            lastChar = lastItem['content'][len(lastItem['content'])-1]
+            if (float(transcript['start_time']) - float(lastItem['start_time']) <= 2.0) and (lastChar != '.' and lastChar != ',' and lastChar != '?' and lastChar != ':' and lastChar != '!'):
+               lastItem['content'] += ' '+ selectedAlternative
+            else:
+                transcripts.append(transcript)
+        else:
+            transcripts.append(transcript)
+    return transcripts
+
+def transcribe_items(count, rng):
+    items = []
+    start_time = 0.0
+    for _ in range(count):
+        start_time += rng.uniform(0.1, 0.8)
+        items.append({'start_time': '%.2f' % start_time, 'end_time': '%.2f' % (start_time + 0.3),
+            'alternatives': [{'confidence': '%.4f' % rng.uniform(0.5, 1.0), 'content': rng.choice(WORDS)}], 'type': 'pronunciation'})
+        if rng.random() < 0.05:
+            items.append({'alternatives': [{'confidence': '0.0', 'content': rng.choice('.?')}], 'type': 'punctuation'})
+    return items
+
+def best_time(function, argument, repeats):
+    best = None
+    for _ in range(repeats):
+        started = time.process_time()
+        function(argument)
+        elapsed = time.process_time() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def measure(build, serialize, items, repeats):
+    tracemalloc.start()
+    result = build(items)
+    retained = tracemalloc.get_traced_memory()[0]
+    output = serialize(result)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return output, best_time(build, items, repeats), best_time(serialize, result, repeats), retained, peak
+
+def ratio(baseline, compact):
+    return '%.1fx' % (baseline / compact)
+
+def compare(name, baseline, compact, items, repeats):
+    baseline_output, baseline_build, baseline_write, baseline_retained, baseline_peak = measure(*baseline, items, repeats)
+    compact_output, compact_build, compact_write, compact_retained, compact_peak = measure(*compact, items, repeats)
+    if baseline_output != compact_output:
+        raise AssertionError('%s attachment JSON differs' % name)
+    print('%-13s dicts   build=%5.1fms write=%5.1fms retained=%5.0fKB peak=%5.0fKB' % (name, baseline_build * 1000,
+        baseline_write * 1000, baseline_retained / 1024, baseline_peak / 1024))
+    print('%-13s columns build=%5.1fms write=%5.1fms retained=%5.0fKB peak=%5.0fKB  build %s faster, %s less retained' % (name,
+        compact_build * 1000, compact_write * 1000, compact_retained / 1024, compact_peak / 1024,
+        ratio(baseline_build, compact_build), ratio(baseline_retained, compact_retained)))
+
+def main():
+    parser = argparse.ArgumentParser(description='Compares dict and column based transcript segments.')
+    parser.add_argument('--items', type=int, default=10000)
+    parser.add_argument('--repeats', type=int, default=30)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    compare('Transcribe', (dict_process_transcript, json.dumps), (processTranscript, lambda segments: segments.to_json()),
+        transcribe_items(args.items, rng), args.repeats)
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,9 @@
 # set logging level
 import os
 import logging
+import re
+import json
+import time
 
 # Configure the logger
 logger = logging.getLogger()
@@ -16,12 +19,33 @@ logger.setLevel(logging.getLevelName(logging_level))
 # Ensure logger is configured properly
 logger.info(f"Logging level set to {logging_level}")
 
-import re
-
 _CONTROL_CHAR_RE = re.compile(r'[\x00-\x08\x0a-\x1f\x7f\x85\u2028\u2029]+')
 
 def sanitize_log(value):
     """Replace control characters to prevent log injection (CWE-117)."""
     if isinstance(value, str):
         return _CONTROL_CHAR_RE.sub('[SANITIZED]', value)
-    return value
\ No newline at end of file
+    return value
+
+# CloudWatch namespace of the metrics written by emit_metrics
+METRICS_NAMESPACE = os.getenv("METRICS_NAMESPACE", "AmazonConnectSalesforceLambda")
+
+def emit_metrics(metrics, dimensions=None, namespace=METRICS_NAMESPACE):
+    """Write metrics in CloudWatch Embedded Metric Format, CloudWatch extracts them from the log without API calls.
+    metrics maps metric names to a value, or to a (value, unit) tuple when the unit is not Count."""
+    dimensions = dimensions or {}
+    document = dict(dimensions)
+    definitions = []
+    for name, value in metrics.items():
+        value, unit = value if isinstance(value, tuple) else (value, 'Count')
+        document[name] = value
+        definitions.append({'Name': name, 'Unit': unit})
+    document['_aws'] = {
+        'Timestamp': int(time.time() * 1000),
+        'CloudWatchMetrics': [{
+            'Namespace': namespace,
+            'Dimensions': [list(dimensions.keys())],
+            'Metrics': definitions
+        }]
+    }
+    print(json.dumps(document))
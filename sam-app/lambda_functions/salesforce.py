@@ -27,10 +27,14 @@ import json, os
 import requests
 import boto3
 import datetime
+from itertools import islice
 from botocore.exceptions import ClientError
 from sf_util import get_arg
 from log_util import logger, sanitize_log
 
+# Maximum number of records accepted by a single sObject Collections request
+COLLECTION_MAX_RECORDS = 200
+
 class Salesforce:
 
   def __init__(self):
@@ -131,6 +135,55 @@ class Salesforce:
     url = '%s/services/data/%s/sobjects/%s/%s/%s' % (self.host, self.version, sobject, field, sobj_id)
     self.makeRequest(self.request.patch, **{"url": url, "data": data})
 
+  def supports_collections(self):
+    # sObject Collections upsert is available from API v46.0
+    return float(self.version.lstrip('vV')) >= 46.0
+
+  def upsert_collection(self, sobject, field, records):
+    logger.info("Salesforce: Upsert collection")
+    if not self.supports_collections():
+      # Older API versions only support upserting one record at a time
+      def upsert(record):
+        data = dict(record)
+        self.update_by_external(sobject, field, data.pop(field), data)
+        return {}
+      return self._write_each(records, upsert)
+
+    url = '%s/services/data/%s/composite/sobjects/%s/%s' % (self.host, self.version, sobject, field)
+    return self._write_collection(self.request.patch, url, sobject, records)
+
+  def create_collection(self, sobject, records):
+    logger.info("Salesforce: Create collection")
+    if float(self.version.lstrip('vV')) < 42.0:
+      # sObject Collections create is available from API v42.0
+      return self._write_each(records, lambda record: {'id': self.create(sobject, record)})
+
+    url = '%s/services/data/%s/composite/sobjects' % (self.host, self.version)
+    return self._write_collection(self.request.post, url, sobject, records)
+
+  def _write_collection(self, method, url, sobject, records):
+    """Sends the records to the sObject Collections url in chunks of COLLECTION_MAX_RECORDS, returns one result per record."""
+    results = []
+    for i in range(0, len(records), COLLECTION_MAX_RECORDS):
+      chunk = records[i:i + COLLECTION_MAX_RECORDS]
+      data = {
+        'allOrNone': False,
+        'records': [dict(record, attributes={'type': sobject}) for record in chunk]
+      }
+      resp = self.makeRequest(method, **{"url": url, "data": data})
+      results.extend(resp.json())
+    return results
+
+  def _write_each(self, records, write):
+    """Calls write(record) for every record, returns results shaped like those of sObject Collections."""
+    results = []
+    for record in records:
+      try:
+        results.append(dict(write(record), success=True, errors=[]))
+      except Exception as e:
+        results.append({'success': False, 'errors': [{'message': str(e)}]})
+    return results
+
   def create(self, sobject, data):
     logger.info("Salesforce: Create")
     url = '%s/services/data/%s/sobjects/%s' % (self.host, self.version, sobject)
@@ -222,6 +275,72 @@ class Salesforce:
           raise e
       return requestMethod(**kwargs)
 
+shared_client = None
+
+def get_salesforce():
+  """Returns a Salesforce client shared by every invocation of a warm container, so credentials and the OAuth token are loaded once."""
+  global shared_client
+  if shared_client is None:
+    shared_client = Salesforce()
+  return shared_client
+
+def batched(iterable, size):
+  iterator = iter(iterable)
+  while True:
+    batch = list(islice(iterator, size))
+    if not batch:
+      return
+    yield batch
+
+class RecordWriteError(Exception):
+  """Raised when a batch could not be written, rows holds the number of rows committed before it."""
+
+  def __init__(self, message, rows):
+    super().__init__(message)
+    self.rows = rows
+
+def write_records(sf, sobject, field, records, batch_size=COLLECTION_MAX_RECORDS, out_of_time=None, digests=None, digest=None):
+  """Upserts an iterable of (external_id, record) pairs in batches of at most batch_size rows.
+  When a digest store is given, rows whose digest(record) matches the one stored for their external id are skipped.
+  No new batch is started once out_of_time() returns True. Returns the number of rows committed, written and skipped
+  and whether the iterable was exhausted."""
+  stats = {'rows': 0, 'written': 0, 'skipped': 0, 'complete': False}
+  try:
+    for batch in batched(records, batch_size):
+      if out_of_time is not None and out_of_time():
+        logger.info("Stopping %s load after %d rows, out of time" % (sobject, stats['rows']))
+        return stats
+
+      changed = [(external_id, record, digest(record) if digests is not None else None) for external_id, record in batch]
+      if digests is not None:
+        stored = digests.get_many([external_id for external_id, _, _ in changed])
+        changed = [item for item in changed if stored[item[0]] != item[2]]
+
+      failed = 0
+      if changed:
+        data = [dict(record, **{field: external_id}) for external_id, record, _ in changed]
+        written = []
+        for (external_id, record, record_digest), result in zip(changed, sf.upsert_collection(sobject, field, data)):
+          if not result['success']:
+            failed += 1
+            logger.error("Failed to upsert %s %s: %s" % (sobject, sanitize_log(external_id), sanitize_log(str(result['errors']))))
+          else:
+            written.append((external_id, record_digest))
+        if digests is not None:
+          digests.put_many(written)
+      if failed:
+        raise Exception("Failed to upsert %d %s records" % (failed, sobject))
+
+      stats['rows'] += len(batch)
+      stats['written'] += len(changed)
+      stats['skipped'] += len(batch) - len(changed)
+  except Exception as e:
+    raise RecordWriteError(str(e), stats['rows']) from e
+
+  logger.info("Upserted %d %s records, skipped %d unchanged" % (stats['written'], sobject, stats['skipped']))
+  stats['complete'] = True
+  return stats
+
 class Request:
   def post(self, url, headers, data=None, params=None, hideData=False):
     logger.info('POST Requests: url=%s' % sanitize_log(url))
@@ -23,9 +23,41 @@ See the License for the specific language governing permissions and
 limitations under the License.
 """
 
-from log_util import logger, sanitize_log
+from log_util import logger, sanitize_log, emit_metrics
+from sf_util import call_with_backoff
+from sfStateStore import get_state_store
+from sfTranscriptStream import iter_channel_items
+from sfTranscriptSegments import TranscriptSegments
+from itertools import groupby
+from concurrent.futures import ThreadPoolExecutor
+from array import array
 import boto3
+import hashlib
 import json
+import os
+import re
+import time
+
+# Comprehend rejects documents over 5000 UTF-8 bytes, transcripts are split into chunks below the limit
+COMPREHEND_MAX_CHUNK_BYTES = int(os.environ.get('COMPREHEND_MAX_CHUNK_BYTES', '4900'))
+COMPREHEND_BATCH_SIZE = 25
+# Analyses of a contact run in parallel on one client
+COMPREHEND_CONCURRENCY = int(os.environ.get('COMPREHEND_CONCURRENCY', '5'))
+# Chunk results are cached by content so retries and reprocessing of a contact do not call Comprehend again,
+# next to the lock files by default, any state store URI or 'none' to disable. Entries are not removed once expired,
+# the bucket needs a lifecycle rule on the comprehend-cache/ prefix
+COMPREHEND_CACHE_URI = os.environ.get('COMPREHEND_CACHE_URI') or ('s3prefix://' + os.environ['TRANSCRIPTS_DESTINATION'] if os.environ.get('TRANSCRIPTS_DESTINATION') else 'none')
+COMPREHEND_CACHE_TTL_SECONDS = int(os.environ.get('COMPREHEND_CACHE_TTL_SECONDS', str(30 * 24 * 3600)))
+BATCH_OPERATIONS = {
+    'snt': 'batch_detect_sentiment',
+    'kw': 'batch_detect_key_phrases',
+    'dl': 'batch_detect_dominant_language',
+    'ne': 'batch_detect_entities',
+    'syn': 'batch_detect_syntax'
+}
+SEGMENT_END_CHARS = '.,?:!'
+SENTENCE_END = re.compile(r'(?<=[.!?])\s+')
+WORD_END = re.compile(r'\s+')
 
 
 def StartComprehendAnalysis(transcripts, compAnalysis, languageCode, segments):
@@ -39,6 +71,34 @@ def StartComprehendAnalysis(transcripts, compAnalysis, languageCode, segments):
     logger.info("Comprehend Analysis: {}".format(sanitize_log(str(cResults))))
     return cResults
 
+def RunComprehendAnalyses(transcripts, compAnalyses, languageCode):
+    """Runs the requested analyses on the entire transcript concurrently and returns their formatted results,
+    keyed by result field such as FormattedSentiment. Unknown analyses are ignored."""
+    comprehend = boto3.client(service_name='comprehend')
+    analyses = [ca for ca in dict.fromkeys(compAnalyses) if ca in FORMATTED_RESULTS]
+    if not analyses:
+        return {}
+
+    def runAnalysis(compAnalysis):
+        started = time.time()
+        cResults = analyzeContactDetail(transcripts, compAnalysis, languageCode, comprehend)
+        logger.info("Comprehend Analysis: {}".format(sanitize_log(str(cResults))))
+        field, formatter = FORMATTED_RESULTS[compAnalysis]
+        return field, formatter(cResults), int((time.time() - started) * 1000)
+
+    started = time.time()
+    with ThreadPoolExecutor(max_workers=min(COMPREHEND_CONCURRENCY, len(analyses))) as executor:
+        futures = {compAnalysis: executor.submit(runAnalysis, compAnalysis) for compAnalysis in analyses}
+
+    comprehendResults = {}
+    for compAnalysis, future in futures.items():
+        field, formatted, latency = future.result()
+        comprehendResults[field] = formatted
+        logger.info('Comprehend %s took %s ms' % (compAnalysis, latency))
+        emit_metrics({'ComprehendLatency': (latency, 'Milliseconds')}, {'Analysis': compAnalysis})
+    emit_metrics({'ComprehendTotalLatency': (int((time.time() - started) * 1000), 'Milliseconds')})
+    return comprehendResults
+
 def analyzeContactSegments(transcripts, compAnalysis, languageCode):
     
     comprehend = boto3.client(service_name='comprehend')
@@ -58,27 +118,192 @@ def analyzeContactSegments(transcripts, compAnalysis, languageCode):
       
     return rComprehend
 
-def analyzeContactDetail(transcripts, compAnalysis, languageCode):
-    comprehend = boto3.client(service_name='comprehend')
-    rComprehend = {}
+def analyzeContactDetail(transcripts, compAnalysis, languageCode, comprehend=None):
+    comprehend = comprehend or boto3.client(service_name='comprehend')
 
     #concat segments
-    finalTranscript = ''
-    for transcript in transcripts:
-        finalTranscript += transcript['content']+' '
-
-    if compAnalysis == "snt":
-      rComprehend = detectSentiment(comprehend, finalTranscript, languageCode)
-    elif compAnalysis == "kw":
-      rComprehend = detectKeyWords(comprehend, finalTranscript, languageCode)
-    elif compAnalysis == "dl":
-      rComprehend = detectDominantLanguage(comprehend, finalTranscript)
-    elif compAnalysis == "ne":
-      rComprehend = detectNamedEntities(comprehend, finalTranscript, languageCode)
-    elif compAnalysis == "syn":
-      rComprehend = detectSyntax(comprehend, finalTranscript, languageCode)
+    contents = transcripts.contents() if isinstance(transcripts, TranscriptSegments) else [transcript['content'] for transcript in transcripts]
+    finalTranscript = ''.join(content + ' ' for content in contents)
+    segmentSpans = []
+    offset = 0
+    for content in contents:
+        segmentSpans.append((offset, offset + len(content)))
+        offset += len(content) + 1
+
+    chunks = chunkTranscript(finalTranscript, segmentSpans)
+    logger.info('Analyzing %s characters in %s chunks' % (len(finalTranscript), len(chunks)))
+    results = detectChunks(comprehend, compAnalysis, [text for offset, text in chunks], languageCode)
+    return AGGREGATORS[compAnalysis](chunks, results)
+
+def chunkTranscript(text, segmentSpans, maxBytes=COMPREHEND_MAX_CHUNK_BYTES):
+    """Splits text into (offset, chunk) pairs of at most maxBytes UTF-8 bytes. Chunks are made of whole segments,
+    segments over the limit are split on sentences, then on words."""
+    spans = []
+    for start, end in segmentSpans:
+        spans.extend(splitSpan(text, start, end, maxBytes))
+
+    chunks = []
+    chunkStart = chunkEnd = None
+    for start, end in spans:
+        if chunkStart is not None and byteLength(text[chunkStart:end]) > maxBytes:
+            chunks.append((chunkStart, text[chunkStart:chunkEnd]))
+            chunkStart = None
+        if chunkStart is None:
+            chunkStart = start
+        chunkEnd = end
+    if chunkStart is not None:
+        chunks.append((chunkStart, text[chunkStart:chunkEnd]))
+    return [(offset, chunk) for offset, chunk in chunks if chunk.strip()]
+
+def splitSpan(text, start, end, maxBytes, separators=(SENTENCE_END, WORD_END)):
+    if byteLength(text[start:end]) <= maxBytes:
+        return [(start, end)]
+    if not separators:
+        # a single word over the limit, cut it on character boundaries
+        spans = []
+        while start < end:
+            cut = start + 1
+            while cut < end and byteLength(text[start:cut + 1]) <= maxBytes:
+                cut += 1
+            spans.append((start, cut))
+            start = cut
+        return spans
+
+    spans = []
+    pieceStart = start
+    for match in separators[0].finditer(text, start, end):
+        spans.extend(splitSpan(text, pieceStart, match.start(), maxBytes, separators[1:]))
+        pieceStart = match.end()
+    spans.extend(splitSpan(text, pieceStart, end, maxBytes, separators[1:]))
+    return [(spanStart, spanEnd) for spanStart, spanEnd in spans if spanEnd > spanStart]
+
+def byteLength(text):
+    return len(text.encode('utf-8'))
+
+def detectChunks(comprehend, compAnalysis, texts, languageCode):
+    """Runs the analysis on every text with the batch APIs, returns the results in the order of the texts,
+    None for texts Comprehend failed on. Cached results are used before calling Comprehend."""
+    cacheKeys = [cacheKey(compAnalysis, languageCode, text) for text in texts]
+    results = getCachedResults(cacheKeys)
+    missing = [index for index, result in enumerate(results) if result is None]
+    logger.info('Comprehend %s: %s of %s chunks cached' % (compAnalysis, len(texts) - len(missing), len(texts)))
+
+    operation = getattr(comprehend, BATCH_OPERATIONS[compAnalysis])
+    detected = {}
+    for batchStart in range(0, len(missing), COMPREHEND_BATCH_SIZE):
+        batch = missing[batchStart:batchStart + COMPREHEND_BATCH_SIZE]
+        textList = [texts[index] for index in batch]
+        if compAnalysis == 'dl':
+            response = call_with_backoff(operation, TextList=textList)
+        else:
+            response = call_with_backoff(operation, TextList=textList, LanguageCode=languageCode)
+        for result in response['ResultList']:
+            index = batch[result.pop('Index')]
+            results[index] = detected[cacheKeys[index]] = result
+        for error in response['ErrorList']:
+            logger.warning('Comprehend %s failed on chunk %s: %s' % (compAnalysis, batch[error['Index']], sanitize_log(error['ErrorMessage'])))
+    putCachedResults(detected)
+
+    if texts and not any(results):
+        raise Exception('Comprehend %s failed on every chunk' % compAnalysis)
+    return results
+
+def cacheKey(compAnalysis, languageCode, text):
+    # the dominant language does not depend on the language of the contact
+    keyLanguage = '' if compAnalysis == 'dl' else languageCode
+    return hashlib.sha256(json.dumps([compAnalysis, keyLanguage, text]).encode('utf-8')).hexdigest()
+
+def getComprehendCache():
+    if COMPREHEND_CACHE_URI == 'none':
+        return None
+    return get_state_store('comprehend-cache', ttl=COMPREHEND_CACHE_TTL_SECONDS, uri=COMPREHEND_CACHE_URI)
+
+def getCachedResults(keys):
+    cache = getComprehendCache()
+    if cache is None or not keys:
+        return [None] * len(keys)
+    try:
+        with ThreadPoolExecutor(max_workers=min(COMPREHEND_BATCH_SIZE, len(keys))) as executor:
+            return list(executor.map(cache.get, keys))
+    except Exception as e:
+        logger.warning('Comprehend cache lookup failed: %s' % sanitize_log(str(e)))
+        return [None] * len(keys)
+
+def putCachedResults(results):
+    cache = getComprehendCache()
+    if cache is None or not results:
+        return
+    try:
+        with ThreadPoolExecutor(max_workers=min(COMPREHEND_BATCH_SIZE, len(results))) as executor:
+            list(executor.map(lambda item: cache.put(*item), results.items()))
+        cache.flush()
+    except Exception as e:
+        logger.warning('Comprehend cache update failed: %s' % sanitize_log(str(e)))
+
+def aggregateSentiment(chunks, results):
+    # chunk scores weighted by the chunk length, the sentiment is the highest aggregated score
+    totals = {'Positive': 0.0, 'Negative': 0.0, 'Neutral': 0.0, 'Mixed': 0.0}
+    totalWeight = 0
+    for (offset, text), result in zip(chunks, results):
+        if result is None:
+            continue
+        for sentiment in totals:
+            totals[sentiment] += result['SentimentScore'][sentiment] * len(text)
+        totalWeight += len(text)
+
+    score = {sentiment: total / totalWeight for sentiment, total in totals.items()} if totalWeight else totals
+    sentiment = max(score, key=score.get).upper() if totalWeight else 'NEUTRAL'
+    return {'Sentiment': sentiment, 'SentimentScore': score}
+
+def aggregateDominantLanguage(chunks, results):
+    totals = {}
+    totalWeight = 0
+    for (offset, text), result in zip(chunks, results):
+        if result is None:
+            continue
+        for language in result['Languages']:
+            totals[language['LanguageCode']] = totals.get(language['LanguageCode'], 0.0) + language['Score'] * len(text)
+        totalWeight += len(text)
 
-    return rComprehend
+    languages = [{'LanguageCode': code, 'Score': total / totalWeight} for code, total in totals.items()]
+    return {'Languages': sorted(languages, key=lambda language: language['Score'], reverse=True)}
+
+def aggregateKeyPhrases(chunks, results):
+    return {'KeyPhrases': mergeDetections(chunks, results, 'KeyPhrases', lambda phrase: phrase['Text'].lower())}
+
+def aggregateNamedEntities(chunks, results):
+    return {'Entities': mergeDetections(chunks, results, 'Entities', lambda entity: (entity['Text'].lower(), entity['Type']))}
+
+def mergeDetections(chunks, results, field, identity):
+    # first occurrence of each detection with offsets into the whole transcript, scored with its best score
+    merged = {}
+    for (offset, text), result in zip(chunks, results):
+        if result is None:
+            continue
+        for detection in result[field]:
+            key = identity(detection)
+            if key in merged:
+                merged[key]['Score'] = max(merged[key]['Score'], detection['Score'])
+                continue
+            merged[key] = dict(detection, BeginOffset=detection['BeginOffset'] + offset, EndOffset=detection['EndOffset'] + offset)
+    return list(merged.values())
+
+def aggregateSyntax(chunks, results):
+    tokens = []
+    for (offset, text), result in zip(chunks, results):
+        if result is None:
+            continue
+        for token in result['SyntaxTokens']:
+            tokens.append(dict(token, TokenId=len(tokens) + 1, BeginOffset=token['BeginOffset'] + offset, EndOffset=token['EndOffset'] + offset))
+    return {'SyntaxTokens': tokens}
+
+AGGREGATORS = {
+    'snt': aggregateSentiment,
+    'kw': aggregateKeyPhrases,
+    'dl': aggregateDominantLanguage,
+    'ne': aggregateNamedEntities,
+    'syn': aggregateSyntax
+}
 
 def detectSentiment(cObject, sentimentText, languageCode):
   logger.info('Detecting Sentiment for: %s' % sanitize_log(sentimentText))
@@ -159,41 +384,60 @@ def GetFormattedSyntax(data):
 
     return json.dumps(entries)
 
+# Result field and formatter of each analysis
+FORMATTED_RESULTS = {
+    'snt': ('FormattedSentiment', GetFormattedSentiment),
+    'kw': ('FormattedKeywords', GetFormattedKeywords),
+    'dl': ('FormattedDominantLanguage', GetFormattedDominantLanguage),
+    'ne': ('FormattedNamedEntities', GetFormattedNamedEntities),
+    'syn': ('FormattedSyntax', GetFormattedSyntax)
+}
+
+def processTranscriptStream(stream):
+    """Returns the segments of each channel of a Transcribe output read from stream, merged while the items
+    are parsed so only the current item and the segments are held in memory."""
+    channels = {}
+    for channelIndex, channelItems in groupby(iter_channel_items(stream), key=lambda channelItem: channelItem[0]):
+        channels[channelIndex] = processTranscript(item for index, item in channelItems)
+    return channels
+
 def processTranscript(iItems):
-    transcripts = []
+    """Merges Transcribe items into segments: words less than 2 seconds after the start of the segment are added to
+    it until a punctuation mark ends it."""
+    startTimes = array('d')
+    endTimes = array('d')
+    contents = []
+    pieces = []
+    segmentStart = None
+    lastChar = ''
     for iTranscript in iItems:
-        transcript = {}
+        alternatives = iTranscript['alternatives']
         if 'start_time' not in iTranscript:
-            if iTranscript['type'] == 'punctuation':
-                if len(transcripts) > 0:
-                    lastItem = transcripts[len(transcripts)-1]
-                    lastChar = lastItem['content'][len(lastItem['content'])-1]
-                    if(lastChar != '.' and lastChar != ',' and lastChar != '?' and lastChar != ':' and lastChar != '!'):
-                        lastItem['content'] += iTranscript['alternatives'][0]['content']
-                        continue
+            if iTranscript['type'] == 'punctuation' and segmentStart is not None and lastChar not in SEGMENT_END_CHARS:
+                content = alternatives[0]['content']
+                if content:
+                    pieces.append(content)
+                    lastChar = content[-1]
             continue
-        transcript['start_time'] = float(iTranscript['start_time'])
-        transcript['end_time'] = float(iTranscript['end_time'])
-        maxAlternativeConfidenceScore = 0.0
-        selectedAlternative = ''
-        for alternative in iTranscript['alternatives']:
-            if(float(alternative['confidence']) > maxAlternativeConfidenceScore):
-                selectedAlternative = alternative['content']
-                maxAlternativeConfidenceScore = alternative['confidence']
-        if(len(selectedAlternative) == 0):  # if the selected alternative to be added is empty then it must not be added. this will prevent lastItem to ever be empty 
-            continue
-        transcript['content'] = selectedAlternative
-        if(len(transcripts)>0):
-            lastItem = transcripts[len(transcripts)-1]
-            lastChar = lastItem['content'][len(lastItem['content'])-1]
-            if (float(transcript['start_time']) - float(lastItem['start_time']) <= 2.0) and (lastChar != '.' and lastChar != ',' and lastChar != '?' and lastChar != ':' and lastChar != '!'):
-               lastItem['content'] += ' '+ selectedAlternative
-            else:
-                transcripts.append(transcript)
-        else:
-            transcripts.append(transcript)
-    return transcripts
 
-    
-        
+        # the most confident alternative, alternatives without confidence or content are not added so a segment is never empty
+        alternative = alternatives[0] if len(alternatives) == 1 else max(alternatives, key=lambda alternative: float(alternative['confidence']))
+        if float(alternative['confidence']) <= 0.0 or not alternative['content']:
+            continue
+        selectedAlternative = alternative['content']
 
+        startTime = float(iTranscript['start_time'])
+        if segmentStart is not None and startTime - segmentStart <= 2.0 and lastChar not in SEGMENT_END_CHARS:
+            pieces.append(' ')
+            pieces.append(selectedAlternative)
+        else:
+            if pieces:
+                contents.append(''.join(pieces))
+            pieces = [selectedAlternative]
+            startTimes.append(startTime)
+            endTimes.append(float(iTranscript['end_time']))
+            segmentStart = startTime
+        lastChar = selectedAlternative[-1]
+    if pieces:
+        contents.append(''.join(pieces))
+    return TranscriptSegments(startTimes, endTimes, contents)
@@ -0,0 +1,109 @@
+"""
+You must have an AWS account to use the Amazon Connect CTI Adapter.
+Downloading and/or using the Amazon Connect CTI Adapter is subject to the terms of the AWS Customer Agreement,
+AWS Service Terms, and AWS Privacy Notice.
+
+© 2017, Amazon Web Services, Inc. or its affiliates. All rights reserved.
+
+NOTE:  Other license terms may apply to certain, identified software components
+contained within or distributed with the Amazon Connect CTI Adapter if such terms are
+included in the LibPhoneNumber-js and Salesforce Open CTI. For such identified components,
+such other license terms will then apply in lieu of the terms above.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import os, time
+from sfStateStore import get_state_store
+from log_util import logger
+
+# Seconds a cached directory is served before it is reloaded
+DIRECTORY_TTL_SECONDS = int(os.environ.get('CONNECT_DIRECTORY_TTL_SECONDS', '300'))
+# Pages of a reload read by each lookup of a stale directory, so the reload is spread over several ticks
+DIRECTORY_REFRESH_PAGES = int(os.environ.get('CONNECT_DIRECTORY_REFRESH_PAGES', '1'))
+
+class ConnectDirectory:
+  """Id to name directory of Amazon Connect resources such as queues or users.
+  The directory is kept in memory and in /tmp, so warm and restarted containers skip the paginated list calls.
+  loader(next_token) returns one page of entries and the token of the next page, None after the last page.
+  Once the directory is older than ttl seconds each lookup reads the next refresh_pages pages of a reload and serves the
+  cached entries updated with them. Entries missing from the listing are dropped once its last page has been read."""
+
+  def __init__(self, name, loader, ttl=DIRECTORY_TTL_SECONDS, refresh_pages=DIRECTORY_REFRESH_PAGES):
+    self.name = name
+    self.loader = loader
+    self.ttl = ttl
+    self.refresh_pages = refresh_pages
+    self.store = get_state_store('connect-directory-' + name, uri='file')
+
+  def entries(self):
+    cached = self.store.get('directory')
+    if cached is None:
+      return self.load()
+    if time.time() - cached['loaded_at'] <= self.ttl:
+      return cached['entries']
+    try:
+      return self.refresh(cached['entries'])
+    except Exception as e:
+      logger.error("Failed to refresh the %s directory, serving cached entries: %s" % (self.name, str(e)))
+      # Page tokens expire, the next lookup starts the reload over
+      self.store.delete('reload')
+      self.store.flush()
+      return cached['entries']
+
+  def load(self):
+    entries = {}
+    next_token = None
+    while True:
+      page, next_token = self.loader(next_token)
+      entries.update(page)
+      if next_token is None:
+        break
+    self.save(entries)
+    return entries
+
+  def refresh(self, cached_entries):
+    """Reads the next pages of the reload in progress, returns the cached entries updated with the pages read so far."""
+    reload = self.store.get('reload') or {'entries': {}, 'next_token': None}
+    for _ in range(self.refresh_pages):
+      page, next_token = self.loader(reload['next_token'])
+      reload['entries'].update(page)
+      reload['next_token'] = next_token
+      if next_token is None:
+        self.store.delete('reload')
+        self.save(reload['entries'])
+        return reload['entries']
+    self.store.put('reload', reload)
+    self.store.flush()
+    return {**cached_entries, **reload['entries']}
+
+  def save(self, entries):
+    self.store.put('directory', {'loaded_at': time.time(), 'entries': entries})
+    self.store.flush()
+    logger.info("Loaded %d entries into the %s directory" % (len(entries), self.name))
+
+def list_queue_names(connect, instance_id, next_token=None):
+  """Loader of one page of the standard queues of the instance, by id."""
+  request = {'InstanceId': instance_id, 'QueueTypes': ['STANDARD']}
+  if next_token:
+    request['NextToken'] = next_token
+  response = connect.list_queues(**request)
+  return {queue['Id']: queue['Name'] for queue in response['QueueSummaryList']}, response.get('NextToken')
+
+def list_user_names(connect, instance_id, next_token=None):
+  """Loader of one page of the user names of the instance, by id."""
+  request = {'InstanceId': instance_id}
+  if next_token:
+    request['NextToken'] = next_token
+  response = connect.list_users(**request)
+  return {user['Id']: user['Username'] for user in response['UserSummaryList']}, response.get('NextToken')
@@ -0,0 +1,110 @@
+"""
+You must have an AWS account to use the Amazon Connect CTI Adapter.
+Downloading and/or using the Amazon Connect CTI Adapter is subject to the terms of the AWS Customer Agreement,
+AWS Service Terms, and AWS Privacy Notice.
+
+© 2017, Amazon Web Services, Inc. or its affiliates. All rights reserved.
+
+NOTE:  Other license terms may apply to certain, identified software components
+contained within or distributed with the Amazon Connect CTI Adapter if such terms are
+included in the LibPhoneNumber-js and Salesforce Open CTI. For such identified components,
+such other license terms will then apply in lieu of the terms above.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import boto3
+import os
+from botocore.exceptions import ClientError
+from log_util import logger, sanitize_log
+
+s3 = boto3.client('s3')
+
+# Contacts are locked with one object per contact next to the transcripts, the body holds the processing status
+LOCK_BUCKET = os.environ.get('TRANSCRIPTS_DESTINATION', '')
+LOCK_PREFIX = 'locks/'
+LOCK_UPDATE_MAX_ATTEMPTS = int(os.environ.get('CONTACT_LOCK_UPDATE_MAX_ATTEMPTS', '5'))
+# Returned when a conditional write loses against another writer
+CONFLICT_ERROR_CODES = ('PreconditionFailed', 'ConditionalRequestConflict', '412', '409')
+# Missing locks surface as AccessDenied when the role cannot list the bucket
+NOT_FOUND_ERROR_CODES = ('404', 'NoSuchKey', 'NotFound', 'AccessDenied', '403')
+
+class ContactLock:
+    """Lock object of a contact. The lock is acquired with a single conditional put that fails when the object
+    already exists, metadata updates compare the ETag of the last read or write so concurrent updates are not lost."""
+
+    def __init__(self, contact_id, bucket=None):
+        self.contact_id = contact_id
+        self.bucket = bucket or LOCK_BUCKET
+        self.key = LOCK_PREFIX + contact_id + '.lock'
+        self.metadata = {}
+        self.etag = None
+
+    def acquire(self, metadata, status='IN_PROGRESS'):
+        """Creates the lock object, returns False when the contact is already locked."""
+        metadata = normalize_metadata(metadata)
+        logger.info('Locking contact: %s' % sanitize_log(self.contact_id))
+        try:
+            response = s3.put_object(Bucket=self.bucket, Key=self.key, Body=status, Metadata=metadata, IfNoneMatch='*')
+        except ClientError as e:
+            if error_code(e) in CONFLICT_ERROR_CODES:
+                logger.warning('Contact already locked: %s' % sanitize_log(self.contact_id))
+                return False
+            raise e
+        self.metadata = metadata
+        self.etag = response['ETag']
+        logger.info('Contact locked: %s' % sanitize_log(self.contact_id))
+        return True
+
+    def load(self):
+        """Reads the lock metadata, returns an empty dict when the contact is not locked."""
+        try:
+            response = s3.head_object(Bucket=self.bucket, Key=self.key)
+        except ClientError as e:
+            if error_code(e) not in NOT_FOUND_ERROR_CODES:
+                raise e
+            logger.info('Contact not locked: %s' % sanitize_log(self.contact_id))
+            self.metadata, self.etag = {}, None
+            return self.metadata
+        self.metadata = response.get('Metadata', {})
+        self.etag = response['ETag']
+        return self.metadata
+
+    def update(self, metadata, status, overwrite=True):
+        """Merges metadata into the lock and sets its status. Existing values win unless overwrite is set. When another
+        writer changed the lock since it was last read the lock is read again and the merge retried."""
+        metadata = normalize_metadata(metadata)
+        if self.etag is None:
+            self.load()
+        for attempt in range(LOCK_UPDATE_MAX_ATTEMPTS):
+            merged = {**self.metadata, **metadata} if overwrite else {**metadata, **self.metadata}
+            conditions = {'IfMatch': self.etag} if self.etag else {'IfNoneMatch': '*'}
+            try:
+                response = s3.put_object(Bucket=self.bucket, Key=self.key, Body=status, Metadata=merged, **conditions)
+            except ClientError as e:
+                if error_code(e) not in CONFLICT_ERROR_CODES or attempt == LOCK_UPDATE_MAX_ATTEMPTS - 1:
+                    raise e
+                logger.info('Lock changed concurrently, reloading: %s' % sanitize_log(self.contact_id))
+                self.load()
+                continue
+            self.metadata = merged
+            self.etag = response['ETag']
+            logger.info('Lock updated: %s' % sanitize_log(self.contact_id))
+            return self.metadata
+
+def normalize_metadata(metadata):
+    # S3 returns user metadata keys in lower case, merging is done on the same keys
+    return {key.lower(): value for key, value in (metadata or {}).items()}
+
+def error_code(e):
+    return str(e.response.get('Error', {}).get('Code'))
@@ -28,10 +28,17 @@ import botocore
 import os
 import json
 import base64
-import uuid
+import hashlib
+from datetime import datetime
 from sf_util import split_s3_bucket_key, invokeSfAPI
+from sfContactLock import ContactLock
 from log_util import logger, sanitize_log
 
+CTR_TIMESTAMP_FORMAT = '%Y-%m-%dT%H:%M:%SZ'
+# Executions that ended in these states are started again under a suffixed name
+RESTARTABLE_EXECUTION_STATUSES = ('FAILED', 'TIMED_OUT', 'ABORTED')
+MAX_EXECUTION_ATTEMPTS = int(os.environ.get('MAX_EXECUTION_ATTEMPTS', '5'))
+
 
 def process_record(record):
     #for record in records:
@@ -44,27 +51,49 @@ def process_record(record):
         logger.info('No contact in record; returning')
         return
 
-    #check if CTR already locked, and proceed if not locked
-    if not checkLockCTR(recordObj['ContactId']):
-        if lockCTR(recordObj['ContactId'], recordObj["Attributes"]):
-            if('Attributes' in recordObj and 'Recording' in recordObj and recordObj["Recording"]!=None and 'Location' in recordObj["Recording"] and recordObj["Recording"]["Status"]=='AVAILABLE' and  recordObj["Recording"]["Type"]=='AUDIO'):
-                #check if postcallRecordingImportEnabled then import call recording file into Salesforce
-                if('postcallRecordingImportEnabled' in recordObj["Attributes"] and recordObj["Attributes"]["postcallRecordingImportEnabled"]=='true'):
-                    logger.info('postcallRecordingImportEnabled = true')
-                    createACContactChannelAnalyticsSalesforceObject(recordObj['ContactId'], recordObj['CustomerEndpoint'], recordObj['Recording']['Location'])
-                elif('postcallRedactedRecordingImportEnabled' in recordObj["Attributes"] and recordObj["Attributes"]["postcallRedactedRecordingImportEnabled"]=="true"):
-                    logger.info('postcallRedactedRecordingImportEnabled = true')
-                    createACContactChannelAnalyticsSalesforceObject(recordObj['ContactId'], recordObj['CustomerEndpoint'])
-                #check if postcallTranscribeEnabled then start the transcribing process
-                if('postcallTranscribeEnabled' in recordObj["Attributes"] and recordObj["Attributes"]["postcallTranscribeEnabled"]=='true' and "postcallTranscribeLanguage" in recordObj["Attributes"]):
-                    executeStateMachine(recordObj['Recording']['Location'], recordObj['ContactId'], recordObj["Attributes"]["postcallTranscribeLanguage"])
+    #lock the CTR, and proceed if it was not locked already
+    lock = lockCTR(recordObj['ContactId'], recordObj["Attributes"])
+    if lock:
+        if('Attributes' in recordObj and 'Recording' in recordObj and recordObj["Recording"]!=None and 'Location' in recordObj["Recording"] and recordObj["Recording"]["Status"]=='AVAILABLE' and  recordObj["Recording"]["Type"]=='AUDIO'):
+            #check if postcallRecordingImportEnabled then import call recording file into Salesforce
+            if('postcallRecordingImportEnabled' in recordObj["Attributes"] and recordObj["Attributes"]["postcallRecordingImportEnabled"]=='true'):
+                logger.info('postcallRecordingImportEnabled = true')
+                createACContactChannelAnalyticsSalesforceObject(lock, recordObj['CustomerEndpoint'], recordObj['Recording']['Location'])
+            elif('postcallRedactedRecordingImportEnabled' in recordObj["Attributes"] and recordObj["Attributes"]["postcallRedactedRecordingImportEnabled"]=="true"):
+                logger.info('postcallRedactedRecordingImportEnabled = true')
+                createACContactChannelAnalyticsSalesforceObject(lock, recordObj['CustomerEndpoint'])
+            #check if postcallTranscribeEnabled then start the transcribing process
+            if('postcallTranscribeEnabled' in recordObj["Attributes"] and recordObj["Attributes"]["postcallTranscribeEnabled"]=='true' and "postcallTranscribeLanguage" in recordObj["Attributes"]):
+                executeStateMachine(recordObj['Recording']['Location'], recordObj['ContactId'], recordObj["Attributes"]["postcallTranscribeLanguage"], getRecordingDuration(recordObj))
+
+
+def getRecordingDuration(recordObj):
+    # Recordings start when the agent is connected, or when the customer reached the system for contacts without an agent
+    start = (recordObj.get('Agent') or {}).get('ConnectedToAgentTimestamp') or recordObj.get('ConnectedToSystemTimestamp')
+    end = recordObj.get('DisconnectTimestamp')
+    if not start or not end:
+        return None
+    try:
+        duration = datetime.strptime(end, CTR_TIMESTAMP_FORMAT) - datetime.strptime(start, CTR_TIMESTAMP_FORMAT)
+    except ValueError:
+        return None
+    return max(0, int(duration.total_seconds()))
+
 
+def getTranscriptionJobName(contactId, s3_object):
+    # The same contact and recording always map to the same job, so replays reuse the job instead of transcribing again
+    return contactId + "_" + hashlib.sha1(s3_object.encode('utf-8')).hexdigest()[:16]
 
 
-def executeStateMachine(s3_object, contactId, languageCode):
+def getExecutionArn(stateMachineArn, executionName):
+    return stateMachineArn.replace(':stateMachine:', ':execution:', 1) + ':' + executionName
+
+
+def executeStateMachine(s3_object, contactId, languageCode, mediaDurationSeconds=None):
     try:
+        jobName = getTranscriptionJobName(contactId, s3_object)
         execution_input = {
-          "jobName": contactId +"_"+uuid.uuid4().hex, #RANDOMNESS
+          "jobName": jobName,
           "mediaFormat": os.environ["MEDIA_FORMAT"],
           "fileUri": "https://s3.amazonaws.com/"+s3_object,
           "languageCode": languageCode,
@@ -73,13 +102,32 @@ def executeStateMachine(s3_object, contactId, languageCode):
           "wait_time": os.environ["WAIT_TIME"],
           "settings" : {"ChannelIdentification" : True}
         }
+        if mediaDurationSeconds is not None:
+            execution_input["mediaDurationSeconds"] = mediaDurationSeconds
         client = boto3.client('stepfunctions')
-        logger.info('Starting Transcribe State Machine: %s' % sanitize_log(str(execution_input)))
-        response = client.start_execution(
-            stateMachineArn=os.environ['TRANSCRIBE_STATE_MACHINE_ARN'],
-            input=json.dumps(execution_input)
-        )
-        logger.info('Transcribe State Machine Response: {}'.format(sanitize_log(str(response))))
+        stateMachineArn = os.environ['TRANSCRIBE_STATE_MACHINE_ARN']
+        # Executions are named after the job, a replayed contact finds the execution it already started. The job
+        # name in the input stays the same when a failed execution is started again.
+        for attempt in range(MAX_EXECUTION_ATTEMPTS):
+            executionName = jobName if attempt == 0 else '%s-%d' % (jobName, attempt)
+            logger.info('Starting Transcribe State Machine %s: %s' % (sanitize_log(executionName), sanitize_log(str(execution_input))))
+            try:
+                response = client.start_execution(
+                    stateMachineArn=stateMachineArn,
+                    name=executionName,
+                    input=json.dumps(execution_input)
+                )
+                logger.info('Transcribe State Machine Response: {}'.format(sanitize_log(str(response))))
+                return
+            except botocore.exceptions.ClientError as e:
+                if e.response['Error']['Code'] != 'ExecutionAlreadyExists':
+                    raise e
+            status = client.describe_execution(executionArn=getExecutionArn(stateMachineArn, executionName))['status']
+            if status not in RESTARTABLE_EXECUTION_STATUSES:
+                logger.info('Transcribe State Machine already started for %s: %s' % (sanitize_log(executionName), status))
+                return
+            logger.info('Transcribe State Machine execution %s ended %s, starting it again' % (sanitize_log(executionName), status))
+        logger.error('Transcribe State Machine not started for %s after %s attempts' % (sanitize_log(jobName), MAX_EXECUTION_ATTEMPTS))
     except Exception as e:
         logger.error('Error: {}'.format(sanitize_log(str(e))))
         logger.error('Current data: {}'.format(sanitize_log(str(execution_input))))
@@ -87,55 +135,25 @@ def executeStateMachine(s3_object, contactId, languageCode):
 
 def lockCTR(ContactId, Attributes):
     try:
-        s3 = boto3.resource('s3')
         oMetadata = {}
 
         if 'postcallTranscribeComprehendAnalysis' in Attributes:
             oMetadata['postcallTranscribeComprehendAnalysis'] = Attributes['postcallTranscribeComprehendAnalysis']
-        logger.info('Locking CTR: {}'.format(sanitize_log(ContactId)))
-        s3.Object(os.environ["TRANSCRIPTS_DESTINATION"], 'locks/' + ContactId + '.lock').put(Body='IN_PROGRESS', Metadata=oMetadata)
-        logger.info('CTR Locked: {}'.format(sanitize_log(ContactId)))
-        return True
+        lock = ContactLock(ContactId)
+        return lock if lock.acquire(oMetadata) else None
     except Exception as e:
         logger.error('Error lock: {}'.format(sanitize_log(str(e))))
         logger.error('Current data: {}'.format(sanitize_log(ContactId)))
         raise e
 
-def checkLockCTR(ContactId):
+def updateLockMetadata(lock, nMetadata):
     try:
-        s3 = boto3.resource('s3')
-        logger.info('Checking if CTR locked: {}'.format(sanitize_log(ContactId)))
-        s3Object = s3.Object(os.environ["TRANSCRIPTS_DESTINATION"], 'locks/' + ContactId + '.lock').load()
-    except botocore.exceptions.ClientError as e:
-        if int(e.response['Error']['Code']=='404'):
-            logger.info('CTR not locked: {}'.format(sanitize_log(ContactId)))
-            return False
-        else:
-            logger.error('Error checkLock: {}'.format(sanitize_log(str(e))))
-            logger.error('Current data: {}'.format(sanitize_log(ContactId)))
-            return False
-    logger.warning('CTR already locked: {}'.format(sanitize_log(ContactId)))
-    return True
-
-def updateLockMetadata(ContactId, nMetadata):
-    try:
-        s3 = boto3.resource('s3')
-
-        logger.info('Load existing metadata from lock object: %s' % sanitize_log(ContactId))
-        s3Object = s3.Object(os.environ["TRANSCRIPTS_DESTINATION"], 'locks/' + ContactId + '.lock')
-
-        oMetadata = s3Object.metadata
-        logger.info('Existing lock object metadata: %s' % sanitize_log(str(oMetadata)))
-
-        fMetadata = {**nMetadata, **oMetadata}
-        logger.info('Updating lock object metadata: %s' % sanitize_log(str(fMetadata)))
-
-        s3.Object(os.environ["TRANSCRIPTS_DESTINATION"], 'locks/' + ContactId + '.lock').put(Body='IN_PROGRESS', Metadata=fMetadata)
-        logger.info('Lock object metadata updated: %s' % sanitize_log(ContactId))
+        logger.info('Updating lock object metadata: %s' % sanitize_log(str(nMetadata)))
+        lock.update(nMetadata, 'IN_PROGRESS', overwrite=False)
         return True
     except Exception as e:
         logger.error('Error updateLockMetadata: {}'.format(sanitize_log(str(e))))
-        logger.error('Current data: {}'.format(sanitize_log(ContactId)))
+        logger.error('Current data: {}'.format(sanitize_log(lock.contact_id)))
         raise e
 
 
@@ -149,7 +167,8 @@ def lambda_handler(event, context):
     except Exception as e:
         raise e
 
-def createACContactChannelAnalyticsSalesforceObject(contactId, customerEndpoint, recordingPath = None):
+def createACContactChannelAnalyticsSalesforceObject(lock, customerEndpoint, recordingPath = None):
+    contactId = lock.contact_id
     pnamespace = os.environ['SF_ADAPTER_NAMESPACE']
     if not pnamespace or pnamespace == '-':
         logger.info("SF_ADAPTER_NAMESPACE is empty")
@@ -173,5 +192,5 @@ def createACContactChannelAnalyticsSalesforceObject(contactId, customerEndpoint,
     #add ACContactChannelAnalyticsId to lock file metadata
     oMetadata = {}
     oMetadata['ACContactChannelAnalyticsId'] = ACContactChannelAnalyticsId
-    updateLockMetadata(contactId, oMetadata)
+    updateLockMetadata(lock, oMetadata)
     return
@@ -23,30 +23,29 @@ See the License for the specific language governing permissions and
 limitations under the License.
 """
 
-import boto3
 import json
-import datetime
 import os
 from log_util import logger
-client = boto3.client('transcribe')
+from sfTranscribeUtil import get_transcription_job, save_task_token, complete_task, schedule_next_poll, FINAL_STATUSES
 
 
 def lambda_handler(event, context):
     try:
-        response = client.get_transcription_job(
-            TranscriptionJobName=event["TranscriptionJobName"]
-        )
-        # BELOW IS THE CODE TO FIX SERIALIZATION ON DATETIME OBJECTS
-        if "CreationTime" in response["TranscriptionJob"]:
-            val = response["TranscriptionJob"]["CreationTime"]
-            response["TranscriptionJob"]["CreationTime"] = val.strftime("%Y-%m-%dT%H:%M:%S.%f%z") if isinstance(val, datetime.datetime) else str(val)
-        if "StartTime" in response["TranscriptionJob"]:
-            val = response["TranscriptionJob"]["StartTime"]
-            response["TranscriptionJob"]["StartTime"] = val.strftime("%Y-%m-%dT%H:%M:%S.%f%z") if isinstance(val, datetime.datetime) else str(val)
-        if "CompletionTime" in response["TranscriptionJob"]:
-            val = response["TranscriptionJob"]["CompletionTime"]
-            response["TranscriptionJob"]["CompletionTime"] = val.strftime("%Y-%m-%dT%H:%M:%S.%f%z") if isinstance(val, datetime.datetime) else str(val)
-        logger.info(response)
-        return response["TranscriptionJob"]
+        if "TaskToken" in event:
+            return register_task_token(event["TranscriptionJobName"], event["TaskToken"])
+
+        job = get_transcription_job(event["TranscriptionJobName"])
+        logger.info(job)
+        return schedule_next_poll(job, event) if "MaxPollSeconds" in event else job
     except Exception as e:
-        raise e
\ No newline at end of file
+        raise e
+
+
+def register_task_token(job_name, task_token):
+    """Called by the state machine when it starts waiting on the job, the job state change event resumes it with the token.
+    The job is checked once the token is saved, in case it finished before anyone could be notified."""
+    save_task_token(job_name, task_token)
+    job = get_transcription_job(job_name)
+    if job["TranscriptionJobStatus"] in FINAL_STATUSES:
+        complete_task(job_name, job, task_token)
+    return {"TranscriptionJobName": job_name, "TranscriptionJobStatus": job["TranscriptionJobStatus"]}
@@ -0,0 +1,50 @@
+"""
+You must have an AWS account to use the Amazon Connect CTI Adapter.
+Downloading and/or using the Amazon Connect CTI Adapter is subject to the terms of the AWS Customer Agreement,
+AWS Service Terms, and AWS Privacy Notice.
+
+© 2017, Amazon Web Services, Inc. or its affiliates. All rights reserved.
+
+NOTE:  Other license terms may apply to certain, identified software components
+contained within or distributed with the Amazon Connect CTI Adapter if such terms are
+included in the LibPhoneNumber-js and Salesforce Open CTI. For such identified components,
+such other license terms will then apply in lieu of the terms above.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import bisect, hashlib
+
+# Points each node gets on the ring, more points spread keys more evenly across nodes
+DEFAULT_VIRTUAL_NODES = 100
+
+def ring_hash(value):
+  return int.from_bytes(hashlib.md5(value.encode('utf-8')).digest()[:8], 'big')
+
+class HashRing:
+  """Consistent hash ring assigning keys to nodes. Each node owns DEFAULT_VIRTUAL_NODES points on the ring, so adding
+  or removing a node only moves the keys of the ring segments it gains or loses, about 1/N of them."""
+
+  def __init__(self, nodes, virtual_nodes=DEFAULT_VIRTUAL_NODES):
+    self.nodes = list(nodes)
+    points = sorted((ring_hash('%s#%d' % (node, i)), node) for node in self.nodes for i in range(virtual_nodes))
+    self.hashes = [point[0] for point in points]
+    self.owners = [point[1] for point in points]
+
+  def node_for(self, key):
+    index = bisect.bisect(self.hashes, ring_hash(key)) % len(self.hashes)
+    return self.owners[index]
+
+def shard_ring(shards):
+  """Ring of shard numbers 0 to shards - 1."""
+  return HashRing(range(shards))
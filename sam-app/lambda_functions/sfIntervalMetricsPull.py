@@ -0,0 +1,229 @@
+"""
+You must have an AWS account to use the Amazon Connect CTI Adapter.
+Downloading and/or using the Amazon Connect CTI Adapter is subject to the terms of the AWS Customer Agreement,
+AWS Service Terms, and AWS Privacy Notice.
+
+© 2017, Amazon Web Services, Inc. or its affiliates. All rights reserved.
+
+NOTE:  Other license terms may apply to certain, identified software components
+contained within or distributed with the Amazon Connect CTI Adapter if such terms are
+included in the LibPhoneNumber-js and Salesforce Open CTI. For such identified components,
+such other license terms will then apply in lieu of the terms above.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import json, os, time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+import boto3
+
+from salesforce import get_salesforce, write_records
+from sf_util import get_field_mapping, call_with_backoff
+from sfConnectDirectory import ConnectDirectory, list_queue_names, list_user_names
+from sfIntervalUtil import ColumnPlan, CHANGE_DETECTION_ENABLED, DIGEST_TTL_DAYS, TIME_BUFFER_MILLIS, BATCH_SIZE
+from sfStateStore import get_state_store
+from log_util import logger, emit_metrics
+import sfIntervalAgent, sfIntervalQueue
+
+connect = boto3.client('connect')
+pnamespace = os.environ['SF_ADAPTER_NAMESPACE']
+if not pnamespace or pnamespace == '-':
+  logger.info("SF_ADAPTER_NAMESPACE is empty")
+  pnamespace = ''
+else:
+  pnamespace = pnamespace + "__"
+
+INTERVAL_PERIODS = {'FIFTEEN_MIN': 900, 'THIRTY_MIN': 1800, 'HOUR': 3600}
+INTERVAL_PERIOD = os.environ.get('INTERVAL_PULL_PERIOD', 'FIFTEEN_MIN')
+# Seconds after an interval closes before its data is pulled, GetMetricDataV2 needs a few minutes to settle
+INTERVAL_DELAY_SECONDS = int(os.environ.get('INTERVAL_PULL_DELAY_SECONDS', '300'))
+# Intervals missed for longer than this, for example while the schedule was disabled, are not backfilled
+MAX_LOOKBACK_SECONDS = int(os.environ.get('INTERVAL_PULL_MAX_LOOKBACK_SECONDS', '86400'))
+# GetMetricDataV2 accepts at most 100 values per filter
+FILTER_MAX_VALUES = 100
+PULL_CONCURRENCY = int(os.environ.get('INTERVAL_PULL_CONCURRENCY', '4'))
+INTERVAL_FORMAT = '%Y-%m-%dT%H:%M:%SZ'
+
+# GetMetricDataV2 metric -> column label of the scheduled historical report, so rows share the field plan of the CSV loads
+QUEUE_METRICS = {
+  'CONTACTS_HANDLED': 'Contacts handled',
+  'CONTACTS_QUEUED': 'Contacts queued',
+  'CONTACTS_ABANDONED': 'Contacts abandoned',
+  'CONTACTS_TRANSFERRED_OUT': 'Contacts transferred out',
+  'AVG_QUEUE_ANSWER_TIME': 'Average queue answer time',
+  'AVG_ABANDON_TIME': 'Average queue abandon time',
+  'AVG_HANDLE_TIME': 'Average handle time',
+  'AVG_HOLD_TIME': 'Average customer hold time',
+  'AVG_INTERACTION_TIME': 'Average agent interaction time',
+  'AVG_AFTER_CONTACT_WORK_TIME': 'Average after contact work time',
+  'MAX_QUEUED_TIME': 'Maximum queued time',
+  'AGENT_NON_RESPONSE': 'Agent non-response'
+}
+AGENT_METRICS = {
+  'CONTACTS_HANDLED': 'Contacts handled',
+  'AVG_HANDLE_TIME': 'Average handle time',
+  'AVG_HOLD_TIME': 'Average customer hold time',
+  'AVG_INTERACTION_TIME': 'Average agent interaction time',
+  'AVG_AFTER_CONTACT_WORK_TIME': 'Average after contact work time',
+  'AGENT_NON_RESPONSE': 'Agent non-response',
+  'AGENT_OCCUPANCY': 'Occupancy',
+  'SUM_ONLINE_TIME_AGENT': 'Online time',
+  'SUM_IDLE_TIME_AGENT': 'Agent idle time',
+  'SUM_NON_PRODUCTIVE_TIME_AGENT': 'Non-Productive Time'
+}
+
+# What is pulled for each target: the filter and grouping, the report columns and the CSV handler whose field plan is reused
+TARGETS = {
+  'queue': {
+    'dimension': 'QUEUE',
+    'name_label': 'Queue',
+    'metrics': QUEUE_METRICS,
+    'sobject': pnamespace + 'AC_HistoricalQueueMetrics__c',
+    'label_parser': sfIntervalQueue.label_parser,
+    'value_parser': sfIntervalQueue.value_parser,
+    'prepare': sfIntervalQueue.prepare_queue_upsert,
+    'loader': list_queue_names
+  },
+  'agent': {
+    'dimension': 'AGENT',
+    'name_label': 'Agent',
+    'metrics': AGENT_METRICS,
+    'sobject': pnamespace + 'AC_AgentPerformance__c',
+    'label_parser': sfIntervalAgent.label_parser,
+    'value_parser': sfIntervalAgent.value_parser,
+    'prepare': sfIntervalAgent.prepare_agent_upsert,
+    'loader': list_user_names
+  }
+}
+
+# Extra metrics by target, a JSON object such as {"queue": {"CONTACTS_HOLD_ABANDONS": "Contacts hold disconnect"}}
+for target_name, metrics in json.loads(os.environ.get('INTERVAL_PULL_EXTRA_METRICS') or '{}').items():
+  TARGETS[target_name]['metrics'].update(metrics)
+
+directories = {}
+
+def lambda_handler(event, context):
+  instance_id = os.environ['AMAZON_CONNECT_INSTANCE_ID']
+  instance_arn = os.environ['AMAZON_CONNECT_INSTANCE_ARN']
+  targets = [target.strip() for target in os.environ.get('INTERVAL_PULL_TARGETS', 'queue,agent').split(',') if target.strip()]
+
+  sf = get_salesforce()
+  region = boto3.session.Session().region_name
+  period = INTERVAL_PERIODS[INTERVAL_PERIOD]
+  # End of the last interval that closed at least INTERVAL_DELAY_SECONDS ago
+  end = int((time.time() - INTERVAL_DELAY_SECONDS) // period * period)
+  pulled = get_state_store('interval-pull-' + instance_id)
+
+  results = {}
+  try:
+    for target_name in targets:
+      start = max(pulled.get(target_name) or end - period, end - MAX_LOOKBACK_SECONDS)
+      if start >= end:
+        logger.info("No closed %s interval to pull" % target_name)
+        continue
+      results[target_name] = pull_target(sf, TARGETS[target_name], instance_id, instance_arn, start, end, region, context)
+      if results[target_name]['complete']:
+        pulled.put(target_name, end)
+  finally:
+    pulled.flush()
+  return results
+
+def pull_target(sf, target, instance_id, instance_arn, start, end, region, context):
+  """Pulls the intervals between start and end for every queue or agent and upserts them like rows of the historical report."""
+  logger.info("Pulling %s intervals from %s to %s" % (target['dimension'], format_time(start), format_time(end)))
+  names = get_directory(target, instance_id).entries()
+  metric_results = fetch_metric_data(target, instance_arn, list(names.keys()), start, end)
+
+  labels = list(target['metrics'].values())
+  header = [target['name_label'], 'StartInterval', 'EndInterval'] + labels
+  field_mapping = get_field_mapping(sf, target['sobject'])
+  constants = {pnamespace + 'Created_Date__c': format_time(time.time())}
+  # Only add the region field if it exists in Salesforce (case-insensitive check)
+  if (pnamespace + 'Region__c').lower() not in field_mapping:
+    region = None
+  if region:
+    constants[pnamespace + 'Region__c'] = region
+  plan = ColumnPlan(header, target['label_parser'], target['value_parser'], field_mapping, constants)
+
+  rows = (to_report_row(target, names, metric_result) for metric_result in metric_results)
+  records = (target['prepare'](plan, row, region) for row in rows)
+  out_of_time = None
+  if context is not None:
+    out_of_time = lambda: context.get_remaining_time_in_millis() < TIME_BUFFER_MILLIS
+
+  digests = None
+  if CHANGE_DETECTION_ENABLED:
+    digests = get_state_store('interval-digests-' + target['sobject'], ttl=DIGEST_TTL_DAYS * 86400)
+  try:
+    stats = write_records(sf, target['sobject'], pnamespace + 'AC_Record_Id__c', records, batch_size=BATCH_SIZE, out_of_time=out_of_time, digests=digests, digest=plan.digest)
+  finally:
+    if digests is not None:
+      digests.flush()
+
+  emit_metrics({'RowsWritten': stats['written'], 'RowsSkipped': stats['skipped']}, {'Object': target['sobject']})
+  return stats
+
+def get_directory(target, instance_id):
+  name = target['dimension'].lower() + 's-' + instance_id
+  if name not in directories:
+    directories[name] = ConnectDirectory(name, lambda next_token: target['loader'](connect, instance_id, next_token))
+  return directories[name]
+
+def fetch_metric_data(target, instance_arn, resource_ids, start, end):
+  """Returns the per interval metric results of every resource, chunks of FILTER_MAX_VALUES ids are fetched concurrently."""
+  chunks = [resource_ids[i:i + FILTER_MAX_VALUES] for i in range(0, len(resource_ids), FILTER_MAX_VALUES)]
+  fetch = lambda chunk: fetch_metric_data_chunk(target, instance_arn, chunk, start, end)
+  if len(chunks) <= 1:
+    results = [fetch(chunk) for chunk in chunks]
+  else:
+    with ThreadPoolExecutor(max_workers=min(PULL_CONCURRENCY, len(chunks))) as executor:
+      results = list(executor.map(fetch, chunks))
+  return [metric_result for chunk_results in results for metric_result in chunk_results]
+
+def fetch_metric_data_chunk(target, instance_arn, resource_ids, start, end):
+  request = {
+    'ResourceArn': instance_arn,
+    'StartTime': datetime.fromtimestamp(start, timezone.utc),
+    'EndTime': datetime.fromtimestamp(end, timezone.utc),
+    'Interval': {'TimeZone': 'UTC', 'IntervalPeriod': INTERVAL_PERIOD},
+    'Filters': [{'FilterKey': target['dimension'], 'FilterValues': resource_ids}],
+    'Groupings': [target['dimension']],
+    'Metrics': [{'Name': name} for name in target['metrics']],
+    'MaxResults': 100
+  }
+  metric_results = []
+  while True:
+    response = call_with_backoff(connect.get_metric_data_v2, **request)
+    metric_results.extend(response.get('MetricResults', []))
+    if not response.get('NextToken'):
+      return metric_results
+    request['NextToken'] = response['NextToken']
+
+def to_report_row(target, names, metric_result):
+  """Lays a metric result out as a row of the historical report, the values are formatted as the report writes them."""
+  resource_id = metric_result['Dimensions'][target['dimension']]
+  interval = metric_result['MetricInterval']
+  values = {collection['Metric']['Name']: collection.get('Value') for collection in metric_result.get('Collections', [])}
+  row = [names.get(resource_id, resource_id), format_time(interval['StartTime']), format_time(interval['EndTime'])]
+  for name in target['metrics']:
+    row.append('' if values.get(name) is None else format_value(values[name]))
+  return row
+
+def format_time(value):
+  if not isinstance(value, datetime):
+    value = datetime.fromtimestamp(value, timezone.utc)
+  return value.astimezone(timezone.utc).strftime(INTERVAL_FORMAT)
+
+def format_value(value):
+  return str(int(value)) if float(value).is_integer() else '%.2f' % value
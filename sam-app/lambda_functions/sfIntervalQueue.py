@@ -23,11 +23,12 @@ See the License for the specific language governing permissions and
 limitations under the License.
 """
 
-import json, csv, urllib.parse, os, re
+import json, os, re
 import boto3
 
 from salesforce import Salesforce
-from sf_util import get_arg, parse_date, split_bucket_key, get_field_mapping, get_filtered_fields
+from sf_util import get_arg, parse_date, split_bucket_key, get_field_mapping, get_s3_event_objects, process_s3_objects, check_s3_results
+from sfIntervalUtil import ColumnPlan, load_report, is_checkpoint_key
 from log_util import logger, sanitize_log
 
 s3 = boto3.client("s3")
@@ -41,41 +42,46 @@ else:
 def lambda_handler(event, context):
   logger.info("event: %s" % sanitize_log(json.dumps(event)))
 
-  event_record = event['Records'][0]
-  bucket = event_record['s3']['bucket']['name']
-  logger.info("bucket: %s" % sanitize_log(bucket))
-  key = urllib.parse.unquote(event_record['s3']['object']['key'])
-  logger.info("key: %s" % sanitize_log(key))
-  data = s3.get_object(Bucket=bucket, Key=key)["Body"].read().decode()
+  # Checkpoints of partially loaded reports live in the reporting bucket as well
+  s3_objects = [s3_object for s3_object in get_s3_event_objects(event) if not is_checkpoint_key(s3_object['key'])]
+  if not s3_objects:
+    logger.info("No reports to process")
+    return {}
 
   sf = Salesforce()
   
   # Get field mapping to handle case sensitivity between Connect and Salesforce
   field_mapping = get_field_mapping(sf, pnamespace + 'AC_HistoricalQueueMetrics__c')
 
-  for record in csv.DictReader(data.split("\n")):
-    queue_record = prepare_queue_record(record, event_record['eventTime'])
-    queue_name = re.sub(r'[-\s\W]+', '', queue_record[pnamespace + 'AC_Object_Name__c'])
-    ac_record_id = "%s%s" % (queue_name, queue_record[pnamespace + 'StartInterval__c'])
-
-    # Only add the region field if it exists in Salesforce (case-insensitive check)
-    if (pnamespace + 'Region__c').lower() in field_mapping:
-        session = boto3.session.Session()
-        queue_record[pnamespace + 'Region__c'] = session.region_name
-        ac_record_id = "%s%s" % (ac_record_id, session.region_name)
-
-    # Filter fields and ensure correct field name casing
-    filtered_record = get_filtered_fields(field_mapping, queue_record)
-    sf.update_by_external(pnamespace + "AC_HistoricalQueueMetrics__c", pnamespace + 'AC_Record_Id__c', ac_record_id, filtered_record)
+  # Only add the region field if it exists in Salesforce (case-insensitive check)
+  region = None
+  if (pnamespace + 'Region__c').lower() in field_mapping:
+    region = boto3.session.Session().region_name
 
+  results = process_s3_objects(s3_objects, lambda s3_object: process_report(sf, field_mapping, region, s3_object, context))
+  response = check_s3_results(results)
   logger.info("Successfully processed historical queue metrics")
-
-def prepare_queue_record(record_raw, current_date):
-  record = {label_parser(k):value_parser(v) for k, v in record_raw.items()}
-  #record[pnamespace + 'Type__c'] = "Queue"
-  record[pnamespace + 'Created_Date__c'] = current_date
-  #record[pnamespace + 'AC_Record_Id__c'] = "%s%s" % (record[pnamespace + 'AC_Object_Name__c'], current_date)
-  return record
+  return dict(response, Results=results)
+
+def process_report(sf, field_mapping, region, s3_object, context):
+  logger.info("bucket: %s" % sanitize_log(s3_object['bucket']))
+  logger.info("key: %s" % sanitize_log(s3_object['key']))
+
+  constants = {pnamespace + 'Created_Date__c': s3_object['eventTime']}
+  if region:
+    constants[pnamespace + 'Region__c'] = region
+
+  # Resolve the report columns to Salesforce fields once for the whole file
+  compile_plan = lambda header: ColumnPlan(header, label_parser, value_parser, field_mapping, constants)
+  prepare = lambda plan, row: prepare_queue_upsert(plan, row, region)
+  return load_report(s3, sf, pnamespace + "AC_HistoricalQueueMetrics__c", pnamespace + 'AC_Record_Id__c', s3_object, compile_plan, prepare, context)
+
+def prepare_queue_upsert(plan, row, region):
+  queue_name = re.sub(r'[-\s\W]+', '', plan.value(row, pnamespace + 'AC_Object_Name__c'))
+  ac_record_id = "%s%s" % (queue_name, plan.value(row, pnamespace + 'StartInterval__c'))
+  if region:
+    ac_record_id = "%s%s" % (ac_record_id, region)
+  return ac_record_id, plan.record(row)
 
 def label_parser(key):
 
@@ -0,0 +1,207 @@
+"""
+You must have an AWS account to use the Amazon Connect CTI Adapter.
+Downloading and/or using the Amazon Connect CTI Adapter is subject to the terms of the AWS Customer Agreement,
+AWS Service Terms, and AWS Privacy Notice.
+
+© 2017, Amazon Web Services, Inc. or its affiliates. All rights reserved.
+
+NOTE:  Other license terms may apply to certain, identified software components
+contained within or distributed with the Amazon Connect CTI Adapter if such terms are
+included in the LibPhoneNumber-js and Salesforce Open CTI. For such identified components,
+such other license terms will then apply in lieu of the terms above.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import csv, gzip, hashlib, io, json, os
+import urllib.parse
+import boto3
+from botocore.exceptions import ClientError
+from itertools import islice
+from sfStateStore import get_state_store
+from salesforce import write_records, RecordWriteError
+from log_util import logger, sanitize_log, emit_metrics
+
+lambda_client = boto3.client('lambda')
+
+# Number of report rows sent to Salesforce per upsert request
+BATCH_SIZE = int(os.environ.get('SF_INTERVAL_BATCH_SIZE', '200'))
+# Remaining execution time below which no new batch is started and the rest of the report is handed to a new invocation
+TIME_BUFFER_MILLIS = int(os.environ.get('SF_INTERVAL_TIME_BUFFER_MILLIS', '15000'))
+# Prefix in the reporting bucket where the last committed row of partially loaded reports is kept
+CHECKPOINT_PREFIX = os.environ.get('SF_INTERVAL_CHECKPOINT_PREFIX', 'interval-checkpoints/')
+# Skip rows whose values did not change since they were last written
+CHANGE_DETECTION_ENABLED = os.environ.get('SF_INTERVAL_CHANGE_DETECTION', 'true').lower() == 'true'
+# Number of days a written row digest is remembered
+DIGEST_TTL_DAYS = int(os.environ.get('SF_INTERVAL_DIGEST_TTL_DAYS', '7'))
+# Number of bytes pulled from the S3 body per read
+READ_CHUNK_SIZE = 64 * 1024
+GZIP_MAGIC = b'\x1f\x8b'
+
+class S3BodyReader(io.RawIOBase):
+  """Exposes a botocore StreamingBody as a raw binary stream so it can be buffered, decompressed and decoded incrementally."""
+
+  def __init__(self, body):
+    self._body = body
+
+  def readable(self):
+    return True
+
+  def readinto(self, buffer):
+    data = self._body.read(len(buffer))
+    buffer[:len(data)] = data
+    return len(data)
+
+  def close(self):
+    if not self.closed:
+      self._body.close()
+    super().close()
+
+def open_report(body):
+  stream = io.BufferedReader(S3BodyReader(body), buffer_size=READ_CHUNK_SIZE)
+  if stream.peek(len(GZIP_MAGIC))[:len(GZIP_MAGIC)] == GZIP_MAGIC:
+    logger.info("Report is gzip compressed")
+    stream = gzip.GzipFile(fileobj=stream, mode='rb')
+  # utf-8-sig drops the BOM Connect writes at the start of the report
+  return io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+
+def iter_report_rows(body):
+  """Yields the report rows as lists of values, the header row first. Blank lines are skipped."""
+  with open_report(body) as report:
+    for row in csv.reader(report):
+      if row:
+        yield row
+
+class ColumnPlan:
+  """Resolves a report header to Salesforce fields once, so rows can be turned into records without
+  parsing labels or filtering fields per cell. Columns without a matching Salesforce field are skipped."""
+
+  def __init__(self, header, label_parser, value_parser, field_mapping, constants=None):
+    self.value_parser = value_parser
+    self.columns = []
+    self.indexes = {}
+    for index, name in enumerate(header):
+      label = label_parser(name)
+      self.indexes[label] = index
+      field = field_mapping.get(label.lower())
+      if field is None:
+        logger.info("Skipping unsupported field: %s" % sanitize_log(name))
+      else:
+        self.columns.append((index, field))
+
+    self.constants = {}
+    for label, value in (constants or {}).items():
+      field = field_mapping.get(label.lower())
+      if field is None:
+        logger.info("Skipping unsupported field: %s" % sanitize_log(label))
+      else:
+        self.constants[field] = value
+
+  def record(self, row):
+    record = dict(self.constants)
+    value_parser = self.value_parser
+    width = len(row)
+    for index, field in self.columns:
+      record[field] = value_parser(row[index]) if index < width else None
+    return record
+
+  def value(self, row, label):
+    index = self.indexes[label]
+    return self.value_parser(row[index]) if index < len(row) else None
+
+  def digest(self, record):
+    """Content hash of the report values of a record, constant fields such as the load date are left out."""
+    values = [record[field] for _, field in self.columns]
+    return hashlib.blake2b(json.dumps(values).encode(), digest_size=16).hexdigest()
+
+def is_checkpoint_key(key):
+  return key.startswith(CHECKPOINT_PREFIX)
+
+def load_checkpoint(s3, bucket, key, etag):
+  try:
+    checkpoint = json.loads(s3.get_object(Bucket=bucket, Key=CHECKPOINT_PREFIX + key + '.json')["Body"].read())
+  except ClientError as e:
+    # Missing checkpoints surface as AccessDenied when the role cannot list the bucket
+    if e.response['Error']['Code'] in ('NoSuchKey', '404', 'AccessDenied', '403'):
+      return 0
+    raise e
+  if checkpoint.get('etag') != etag:
+    logger.info("Ignoring checkpoint of a previous version of %s" % sanitize_log(key))
+    return 0
+  return checkpoint['rows']
+
+def save_checkpoint(s3, bucket, key, etag, rows):
+  logger.info("Saving checkpoint for %s at row %d" % (sanitize_log(key), rows))
+  s3.put_object(Bucket=bucket, Key=CHECKPOINT_PREFIX + key + '.json', Body=json.dumps({'etag': etag, 'rows': rows}), ContentType='application/json')
+
+def delete_checkpoint(s3, bucket, key):
+  s3.delete_object(Bucket=bucket, Key=CHECKPOINT_PREFIX + key + '.json')
+
+def enqueue_continuation(context, s3_object):
+  """Invokes the current function asynchronously with an S3 event for the object, the checkpoint tells it where to resume."""
+  logger.info("Enqueuing continuation for s3://%s/%s" % (sanitize_log(s3_object['bucket']), sanitize_log(s3_object['key'])))
+  event = {'Records': [{
+    'eventTime': s3_object['eventTime'],
+    's3': {'bucket': {'name': s3_object['bucket']}, 'object': {'key': urllib.parse.quote(s3_object['key'])}}
+  }]}
+  lambda_client.invoke(FunctionName=context.invoked_function_arn, InvocationType='Event', Payload=json.dumps(event))
+
+def load_report(s3, sf, sobject, field, s3_object, compile_plan, prepare, context=None):
+  """Loads one report object into Salesforce, resuming from its checkpoint.
+  compile_plan(header) returns the ColumnPlan of the report and prepare(plan, row) the (external_id, record) pair of a row.
+  When the invocation runs out of time the last committed row is checkpointed and the rest is handed to a new invocation."""
+  bucket = s3_object['bucket']
+  key = s3_object['key']
+  report = s3.get_object(Bucket=bucket, Key=key)
+  etag = report['ETag']
+  start_row = load_checkpoint(s3, bucket, key, etag)
+
+  rows = iter_report_rows(report['Body'])
+  header = next(rows, None)
+  if header is None:
+    logger.warning("Report is empty: %s" % sanitize_log(key))
+    return {'rows': 0, 'written': 0, 'skipped': 0, 'complete': True}
+
+  plan = compile_plan(header)
+  if start_row:
+    logger.info("Resuming %s from row %d" % (sanitize_log(key), start_row))
+    rows = islice(rows, start_row, None)
+
+  out_of_time = None
+  if context is not None:
+    out_of_time = lambda: context.get_remaining_time_in_millis() < TIME_BUFFER_MILLIS
+
+  digests = None
+  if CHANGE_DETECTION_ENABLED:
+    digests = get_state_store('interval-digests-' + sobject, ttl=DIGEST_TTL_DAYS * 86400)
+
+  try:
+    stats = write_records(sf, sobject, field, (prepare(plan, row) for row in rows), batch_size=BATCH_SIZE, out_of_time=out_of_time, digests=digests, digest=plan.digest)
+  except RecordWriteError as e:
+    if e.rows:
+      save_checkpoint(s3, bucket, key, etag, start_row + e.rows)
+    raise e
+  finally:
+    if digests is not None:
+      digests.flush()
+
+  emit_metrics({'RowsWritten': stats['written'], 'RowsSkipped': stats['skipped']}, {'Object': sobject})
+
+  stats['rows'] += start_row
+  if stats['complete']:
+    if start_row:
+      delete_checkpoint(s3, bucket, key)
+  else:
+    save_checkpoint(s3, bucket, key, etag, stats['rows'])
+    enqueue_continuation(context, s3_object)
+  return stats
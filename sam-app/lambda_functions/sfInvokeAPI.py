@@ -44,48 +44,48 @@ def removekey(d, key):
 
 def lambda_handler(event, context):
   logger.info("event: %s" % sanitize_log(json.dumps(event)))
-  sf = Salesforce()
+  resp = invoke(Salesforce(), event)
+  logger.info("result: %s" % sanitize_log(str(resp)))
+  return resp
 
-  sf_operation = str(event['Details']['Parameters']['sf_operation'])
+def invoke(sf, event):
+  """Runs the sf_operation of an sfInvokeAPI event with the given Salesforce client, the event is left unchanged.
+  Called by the Lambda handler and in process by sf_util.invokeSfAPI."""
   parameters = dict(event['Details']['Parameters'])
-  del parameters['sf_operation']
-  event['Details']['Parameters'] = parameters
+  sf_operation = str(parameters.pop('sf_operation'))
 
   if(sf_operation == "lookup"):
-    resp = lookup(sf=sf, **event['Details']['Parameters'])
+    return lookup(sf=sf, **parameters)
   elif (sf_operation == "create"):
-    resp = create(sf=sf, **event['Details']['Parameters'])
+    return create(sf=sf, **parameters)
   elif (sf_operation == "update"):
-    resp = update(sf=sf, **event['Details']['Parameters'])
+    return update(sf=sf, **parameters)
   elif (sf_operation == "phoneLookup"):
-    resp = phoneLookup(sf, event['Details']['Parameters']['sf_phone'], event['Details']['Parameters']['sf_fields'])
+    return phoneLookup(sf, parameters['sf_phone'], parameters['sf_fields'])
   elif (sf_operation == "delete"):
-    resp = delete(sf=sf, **event['Details']['Parameters'])
+    return delete(sf=sf, **parameters)
   elif (sf_operation == "lookup_all"):
-    resp = lookup_all(sf=sf, **event['Details']['Parameters'])
+    return lookup_all(sf=sf, **parameters)
   elif (sf_operation == "query"):
-    resp = query(sf=sf, **event['Details']['Parameters'])
+    return query(sf=sf, **parameters)
   elif (sf_operation == "queryOne"):
-    resp = queryOne(sf=sf, **event['Details']['Parameters'])
+    return queryOne(sf=sf, **parameters)
   elif (sf_operation == "createChatterPost"):
-    resp = createChatterPost(sf=sf, **event['Details']['Parameters'])
+    return createChatterPost(sf=sf, **parameters)
   elif (sf_operation == "createChatterComment"):
-    resp = createChatterComment(sf=sf, **event['Details']['Parameters'])
+    return createChatterComment(sf=sf, **parameters)
   elif (sf_operation == "search"):
-    resp = search(sf=sf, **event['Details']['Parameters'])
+    return search(sf=sf, **parameters)
   elif (sf_operation == "searchOne"):
-    resp = searchOne(sf=sf, **event['Details']['Parameters'])
+    return searchOne(sf=sf, **parameters)
   elif (sf_operation == "searchSOSL"):
-    resp = searchSOSL(sf=sf, **event['Details']['Parameters'])
+    return searchSOSL(sf=sf, **parameters)
   elif (sf_operation == "searchOneSOSL"):
-    resp = searchOneSOSL(sf=sf, **event['Details']['Parameters'])
+    return searchOneSOSL(sf=sf, **parameters)
   else:
     msg = "sf_operation unknown"
     logger.error(msg)
     raise Exception(msg)
-  
-  logger.info("result: %s" % sanitize_log(str(resp)))
-  return resp
 
 # ****WARNING**** -- this function will be deprecated in future versions of the integration; please use search/searchOne.
 def lookup(sf, sf_object, sf_fields, **kwargs):
@@ -23,12 +23,12 @@ See the License for the specific language governing permissions and
 limitations under the License.
 """
 
-import json, csv, urllib.parse, os
-import boto3
+import json, csv, os
 import botocore
 import base64
 from log_util import logger, sanitize_log
-from sf_util import getS3FileMetadata, getS3FileJSONObject, getBase64String, attachFileSaleforceObject, invokeSfAPI, split_s3_bucket_key
+from sfContactLock import ContactLock
+from sf_util import getS3FileJSONObject, getBase64String, attachFileSaleforceObject, invokeSfAPI, split_s3_bucket_key, get_s3_event_objects, process_s3_objects, check_s3_results
 from sfContactLensUtil import processContactLensTranscript, processContactLensConversationCharacteristics, getDataSource, getContactAttributes
 
 def lambda_handler(event, context):
@@ -40,62 +40,68 @@ def lambda_handler(event, context):
     try:
         logger.info('Received event: %s' % sanitize_log(json.dumps(event)))
 
-        event_record = event['Records'][0]
-        bucket = event_record['s3']['bucket']['name']
-        logger.info("ContactLens file bucket: %s" % sanitize_log(bucket))
-
-        key = urllib.parse.unquote(event_record['s3']['object']['key'])
-        logger.info("ContactLens file key: %s" % sanitize_log(key))
-
-        logger.info('Retrieving ContactLens file: %s', key)
-        contactLensObj = getS3FileJSONObject(bucket, key)
-        logger.info('Retrieved ContactLens file: %s', key)
-
-        contactId = contactLensObj['CustomerMetadata']['ContactId']
-
-        # Check contact attributes
-        contactAttributes = getContactAttributes(contactLensObj)
-        if ("contactLensImportEnabled" not in contactAttributes or "contactLensImportEnabled" in contactAttributes and contactAttributes["contactLensImportEnabled"] != 'true'):
-            logger.warning("Contact Lens import not enabled!")
-            return {"Done": False}
-
-        # Check if Connect instanceId in contact lens object matches env variable
-        if not isValidContactLensData(contactLensObj):
-            logger.warning('Wrong Contact Lens data for Amazon Connect instance %s', os.environ["AMAZON_CONNECT_INSTANCE_ID"])
-            return {"Done": False}
-
-        logger.info('Getting lock file metadata: %s ' % sanitize_log(contactId))
-        mACContactChannelAnalyticsId = None
-        oMetadata = None
-        transcribeBucketExists = os.environ['TRANSCRIPTS_DESTINATION'] != ''
-        if transcribeBucketExists:
-            oMetadata = getS3FileMetadata(os.environ['TRANSCRIPTS_DESTINATION'], contactId)
-            
-            if 'ACContactChannelAnalyticsId'.lower() in oMetadata:
-                mACContactChannelAnalyticsId = oMetadata['ACContactChannelAnalyticsId'.lower()]
-
-        logger.info('Processing ContactLens transcript')
-        participants = contactLensObj['Participants']
-        ContactLensTranscripts = processContactLensTranscript(contactLensObj['Transcript'], participants)
-        
-        # customerTranscripts = ','.join(str(transcript) for transcript in ContactLensTranscripts['customerTranscripts'])
-        # agentTranscripts = ','.join(str(transcript) for transcript in ContactLensTranscripts['agentTranscripts'])
-        contactLensTranscripts = ContactLensTranscripts['finalTranscripts']
-        
-        logger.info('Processing Conversation Characteristics')
-        contactLensConversationCharacteristics = processContactLensConversationCharacteristics(contactLensObj, bucket, contactLensTranscripts, key)
-
-        createSalesforceObject(contactId, contactLensTranscripts, contactLensConversationCharacteristics, mACContactChannelAnalyticsId)
-
-        if transcribeBucketExists:
-            logger.info('Updating s3 metadata')
-            updateLock(os.environ['TRANSCRIPTS_DESTINATION'], contactId, oMetadata)
+        results = process_s3_objects(get_s3_event_objects(event), processContactLensObject)
+        response = check_s3_results(results)
 
         logger.info('Done')
-        return {"Done": True}
+        return dict(response, Done=all(result.get('result') for result in results), Results=results)
     except Exception as e:
         raise e
 
+def processContactLensObject(s3_object):
+    bucket = s3_object['bucket']
+    logger.info("ContactLens file bucket: %s" % sanitize_log(bucket))
+
+    key = s3_object['key']
+    logger.info("ContactLens file key: %s" % sanitize_log(key))
+
+    logger.info('Retrieving ContactLens file: %s', key)
+    contactLensObj = getS3FileJSONObject(bucket, key)
+    logger.info('Retrieved ContactLens file: %s', key)
+
+    contactId = contactLensObj['CustomerMetadata']['ContactId']
+
+    # Check contact attributes
+    contactAttributes = getContactAttributes(contactLensObj)
+    if ("contactLensImportEnabled" not in contactAttributes or "contactLensImportEnabled" in contactAttributes and contactAttributes["contactLensImportEnabled"] != 'true'):
+        logger.warning("Contact Lens import not enabled!")
+        return False
+
+    # Check if Connect instanceId in contact lens object matches env variable
+    if not isValidContactLensData(contactLensObj):
+        logger.warning('Wrong Contact Lens data for Amazon Connect instance %s', os.environ["AMAZON_CONNECT_INSTANCE_ID"])
+        return False
+
+    logger.info('Getting lock file metadata: %s ' % sanitize_log(contactId))
+    mACContactChannelAnalyticsId = None
+    oMetadata = None
+    transcribeBucketExists = os.environ['TRANSCRIPTS_DESTINATION'] != ''
+    if transcribeBucketExists:
+        lock = ContactLock(contactId, os.environ['TRANSCRIPTS_DESTINATION'])
+        oMetadata = lock.load()
+        
+        if 'ACContactChannelAnalyticsId'.lower() in oMetadata:
+            mACContactChannelAnalyticsId = oMetadata['ACContactChannelAnalyticsId'.lower()]
+
+    logger.info('Processing ContactLens transcript')
+    participants = contactLensObj['Participants']
+    ContactLensTranscripts = processContactLensTranscript(contactLensObj['Transcript'], participants)
+    
+    # customerTranscripts = ','.join(str(transcript) for transcript in ContactLensTranscripts['customerTranscripts'])
+    # agentTranscripts = ','.join(str(transcript) for transcript in ContactLensTranscripts['agentTranscripts'])
+    contactLensTranscripts = ContactLensTranscripts['finalTranscripts']
+    
+    logger.info('Processing Conversation Characteristics')
+    contactLensConversationCharacteristics = processContactLensConversationCharacteristics(contactLensObj, bucket, contactLensTranscripts, key)
+
+    createSalesforceObject(contactId, contactLensTranscripts, contactLensConversationCharacteristics, mACContactChannelAnalyticsId)
+
+    if transcribeBucketExists:
+        logger.info('Updating s3 metadata')
+        updateLock(lock, oMetadata)
+
+    return True
+
 def createSalesforceObject(contactId, contactLensTranscripts, contactLensConversationCharacteristics, mACContactChannelAnalyticsId):
     
     pnamespace = os.environ['SF_ADAPTER_NAMESPACE']
@@ -165,16 +171,15 @@ def createSalesforceObject(contactId, contactLensTranscripts, contactLensConvers
         logger.info('SF Transcript Attached - Contact Lens')
         
         
-def updateLock(Bucket, ContactId, oMetadata):
+def updateLock(lock, oMetadata):
     try:
-        s3r = boto3.resource('s3')
-        logger.info('Updating lock file: %s' % sanitize_log(ContactId))
-        s3r.Object(Bucket, 'locks/' + ContactId + '.lock').put(Body='COMPLETED', Metadata=oMetadata)
-        logger.info('Lock file updated: %s' % sanitize_log(ContactId))
+        logger.info('Updating lock file: %s' % sanitize_log(lock.contact_id))
+        lock.update(oMetadata, 'COMPLETED')
+        logger.info('Lock file updated: %s' % sanitize_log(lock.contact_id))
         return True
     except Exception as e:
         logger.error('Error lock: {}'.format(sanitize_log(str(e))))
-        logger.error('Current data: {}'.format(sanitize_log(ContactId)))
+        logger.error('Current data: {}'.format(sanitize_log(lock.contact_id)))
         raise e
 
 def isValidContactLensData(contactLensObj):
@@ -24,13 +24,14 @@ limitations under the License.
 """
 
 import json
-import boto3
 import botocore
 import os
 import base64
 from log_util import logger, sanitize_log
-from sf_util import getS3FileMetadata, getS3FileJSONObject, getBase64String, attachFileSaleforceObject, invokeSfAPI
-from sfComprehendUtil import StartComprehendAnalysis, GetFormattedSentiment, GetFormattedKeywords, GetFormattedDominantLanguage, GetFormattedNamedEntities, GetFormattedSyntax, processTranscript
+from sfContactLock import ContactLock
+from sf_util import getS3FileStream, getBase64String, attachFileSaleforceObject, invokeSfAPI
+from sfComprehendUtil import RunComprehendAnalyses, processTranscriptStream
+from sfTranscriptSegments import TranscriptSegments
 
 def lambda_handler(event, context):
     try:
@@ -42,7 +43,8 @@ def lambda_handler(event, context):
         contactId = event["TranscriptionJob"]["TranscriptionJobName"].split('_')[0]
 
         logger.info('Getting lock file metadata: %s ' % sanitize_log(contactId))
-        oMetadata = getS3FileMetadata(bucket, key.split('_')[0])
+        lock = ContactLock(key.split('_')[0], bucket)
+        oMetadata = lock.load()
 
         postcallTranscribeComprehendAnalysis = []
         if 'postcallTranscribeComprehendAnalysis'.lower() in oMetadata:
@@ -52,36 +54,22 @@ def lambda_handler(event, context):
         if 'ACContactChannelAnalyticsId'.lower() in oMetadata:
             mACContactChannelAnalyticsId = oMetadata['ACContactChannelAnalyticsId'.lower()]
 
-        logger.info('Retrieving transcription file: %s', key)
-        transcriptObj = getS3FileJSONObject(bucket, key)
-        logger.info('Retrieved transcription file: %s', key)
+        logger.info('Processing transcription file: %s', key)
+        channelTranscripts = processTranscriptStream(getS3FileStream(bucket, key))
+        logger.info('Processed transcription file: %s', key)
 
-        logger.info('Processing Customer transcript')
-        customerTranscripts = processTranscript(transcriptObj['results']['channel_labels']['channels'][0]['items'])
-        logger.info('Customer transcript: %s' % sanitize_log(customerTranscripts))
-        logger.info('Processing Agent transcript')
-        agentTranscripts = processTranscript(transcriptObj['results']['channel_labels']['channels'][1]['items'])
-        logger.info('Agent transcript: %s' % sanitize_log(agentTranscripts))
+        customerTranscripts = channelTranscripts.get(0, TranscriptSegments())
+        logger.info('Customer transcript: %s segments' % len(customerTranscripts))
+        agentTranscripts = channelTranscripts.get(1, TranscriptSegments())
+        logger.info('Agent transcript: %s segments' % len(agentTranscripts))
 
         comprehendResults = {}
-        #Test Comprehend
         if len(customerTranscripts) > 0:
-            for ca in postcallTranscribeComprehendAnalysis:
-                if ca == 'snt':
-                    comprehendResults['FormattedSentiment'] = GetFormattedSentiment(StartComprehendAnalysis(customerTranscripts, 'snt', languageCode, False))
-                elif ca=='kw':
-                    comprehendResults['FormattedKeywords'] = GetFormattedKeywords(StartComprehendAnalysis(customerTranscripts, 'kw', languageCode, False))
-                elif ca=='dl':
-                    comprehendResults['FormattedDominantLanguage'] = GetFormattedDominantLanguage(StartComprehendAnalysis(customerTranscripts, 'dl', languageCode, False))
-                elif ca=='ne':
-                    comprehendResults['FormattedNamedEntities'] = GetFormattedNamedEntities(StartComprehendAnalysis(customerTranscripts, 'ne', languageCode, False))
-                elif ca=='syn':
-                    comprehendResults['FormattedSyntax'] = GetFormattedSyntax(StartComprehendAnalysis(customerTranscripts, 'syn', languageCode, False))
-        #End Test Comprehend
+            comprehendResults = RunComprehendAnalyses(customerTranscripts, postcallTranscribeComprehendAnalysis, languageCode)
         
         createSalesforceObject(contactId, customerTranscripts, agentTranscripts, comprehendResults, mACContactChannelAnalyticsId)
 
-        updateLock(bucket, key.split('_')[0], oMetadata)
+        updateLock(lock, oMetadata)
 
         logger.info('Done')
         return {"Done": True}
@@ -123,12 +111,12 @@ def createSalesforceObject(contactId, customerTranscripts, agentTranscripts, com
 
     if len(customerTranscripts) > 0:
         logger.info('Attaching SF Transcript - Customer Side')
-        attachFileSaleforceObject('CustomerTranscripts.json', 'application/json', 'Call Recording Transcription - Customer Side', ACContactChannelAnalyticsId, getBase64String(customerTranscripts))
+        attachFileSaleforceObject('CustomerTranscripts.json', 'application/json', 'Call Recording Transcription - Customer Side', ACContactChannelAnalyticsId, getBase64String(customerTranscripts.to_json()))
         logger.info('SF Transcript Attached - Customer Side')
 
     if len(agentTranscripts) > 0:
         logger.info('Attaching SF Transcript - Agent Side')
-        attachFileSaleforceObject('AgentTranscripts.json', 'application/json', 'Call Recording Transcription - Agent Side', ACContactChannelAnalyticsId, getBase64String(agentTranscripts))
+        attachFileSaleforceObject('AgentTranscripts.json', 'application/json', 'Call Recording Transcription - Agent Side', ACContactChannelAnalyticsId, getBase64String(agentTranscripts.to_json()))
         logger.info('SF Transcript Attached - Agent Side')
 
     if 'FormattedSyntax' in comprehendResults:
@@ -136,15 +124,13 @@ def createSalesforceObject(contactId, customerTranscripts, agentTranscripts, com
         attachFileSaleforceObject('ComprehendSyntax.json', 'application/json', 'Comprehend Syntax', ACContactChannelAnalyticsId, getBase64String(comprehendResults['FormattedSyntax']))
         logger.info('SF Comprehend Syntax Attached')
 
-def updateLock(Bucket, ContactId, oMetadata):
+def updateLock(lock, oMetadata):
     try:
-        s3r = boto3.resource('s3')
-        logger.info('Updating lock file: %s' % sanitize_log(ContactId))
-        s3r.Object(Bucket, 'locks/' + ContactId + '.lock').put(Body='COMPLETED', Metadata=oMetadata)
-        logger.info('Lock file updated: %s' % sanitize_log(ContactId))
+        logger.info('Updating lock file: %s' % sanitize_log(lock.contact_id))
+        lock.update(oMetadata, 'COMPLETED')
+        logger.info('Lock file updated: %s' % sanitize_log(lock.contact_id))
         return True
     except Exception as e:
         logger.error('Error lock: {}'.format(sanitize_log(str(e))))
-        logger.error('Current data: {}'.format(sanitize_log(ContactId)))
-        raise e
-    
\ No newline at end of file
+        logger.error('Current data: {}'.format(sanitize_log(lock.contact_id)))
+        raise e
\ No newline at end of file
@@ -0,0 +1,219 @@
+"""
+You must have an AWS account to use the Amazon Connect CTI Adapter.
+Downloading and/or using the Amazon Connect CTI Adapter is subject to the terms of the AWS Customer Agreement,
+AWS Service Terms, and AWS Privacy Notice.
+
+© 2017, Amazon Web Services, Inc. or its affiliates. All rights reserved.
+
+NOTE:  Other license terms may apply to certain, identified software components
+contained within or distributed with the Amazon Connect CTI Adapter if such terms are
+included in the LibPhoneNumber-js and Salesforce Open CTI. For such identified components,
+such other license terms will then apply in lieu of the terms above.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import json, os, time
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+import boto3
+from salesforce import get_salesforce, write_records
+from sf_util import get_field_mapping, call_with_backoff
+from sfStateStore import get_state_store
+from sfConnectDirectory import ConnectDirectory, list_user_names
+from sfTickScheduler import is_scheduled_event, scheduled_time, run_ticks, follows_previous_tick
+from log_util import logger, emit_metrics
+
+objectnamespace = os.environ['SF_ADAPTER_NAMESPACE']
+
+if not objectnamespace  or objectnamespace == '-':
+    logger.info("SF_ADAPTER_NAMESPACE is empty")
+    objectnamespace = ''
+else:
+    objectnamespace = objectnamespace + "__"
+#get connect reference
+connect=boto3.client('connect')
+
+# Salesforce object holding one row per agent, upserted by Agent_Id__c
+AGENT_STATUS_SOBJECT = objectnamespace + os.environ.get('AGENT_STATUS_SOBJECT', 'AC_AgentStatus__c')
+AGENT_ID_FIELD = objectnamespace + 'Agent_Id__c'
+# GetCurrentUserData accepts at most 100 agent ids in its Agents filter
+AGENT_FILTER_MAX_IDS = 100
+# Number of agent id chunks fetched concurrently
+AGENT_STATUS_CONCURRENCY = int(os.environ.get('AGENT_STATUS_CONCURRENCY', '8'))
+# Unchanged agents are republished at least this often, so rows edited or lost in Salesforce are repaired
+FULL_REFRESH_SECONDS = int(os.environ.get('AGENT_STATUS_FULL_REFRESH_SECONDS', '300'))
+# A scheduled invocation refreshes the agent states every TICK_SECONDS until the next one, SCHEDULE_SECONDS later
+TICK_SECONDS = float(os.environ.get('AGENT_STATUS_TICK_SECONDS', '15'))
+SCHEDULE_SECONDS = float(os.environ.get('AGENT_STATUS_SCHEDULE_SECONDS', '60'))
+# Status published for agents that dropped out of GetCurrentUserData since the previous tick, usually because they logged out
+OFFLINE_STATUS_NAME = os.environ.get('AGENT_STATUS_OFFLINE_STATUS', 'Offline')
+# Seconds the AC_AgentStatus__c describe is reused by a warm container
+SCHEMA_TTL_SECONDS = int(os.environ.get('SF_SCHEMA_TTL_SECONDS', '3600'))
+schema_region = None
+schema_loaded_at = None
+user_directory = None
+
+def lambda_handler(event, context):
+    logger.info("Start")
+    instance_id = os.environ['AMAZON_CONNECT_INSTANCE_ID']
+    logger.info(f"instance id: {instance_id}")
+
+    if is_scheduled_event(event):
+        ticks = run_ticks(lambda: sync_tick(instance_id), TICK_SECONDS, SCHEDULE_SECONDS, context, scheduled_at=scheduled_time(event))
+        logger.info(f"Ran {ticks} ticks")
+    else:
+        sync_tick(instance_id)
+
+
+def sync_tick(instance_id):
+    started = time.time()
+    user_id_name_dict = get_user_directory(instance_id).entries()
+    if len(user_id_name_dict) == 0:
+        logger.info("No agents to sync")
+        return
+
+    user_data_list = ac_user_data(list(user_id_name_dict.keys()), instance_id)
+    fetched = time.time()
+    stats = sync_agent_status(user_id_name_dict, user_data_list)
+    emit_metrics({
+        'UserDataFetchLatency': (int((fetched - started) * 1000), 'Milliseconds'),
+        'TickLatency': (int((time.time() - started) * 1000), 'Milliseconds'),
+        'AgentsPublished': stats['written'],
+        'AgentsSuppressed': stats['skipped']
+    })
+
+
+def get_user_directory(instance_id):
+    global user_directory
+    if user_directory is None:
+        user_directory = ConnectDirectory('users-' + instance_id, lambda next_token: list_user_names(connect, instance_id, next_token))
+    return user_directory
+
+
+def ac_user_data(user_ids, instance_id):
+    """Returns the current data of every agent. The Agents filter accepts at most AGENT_FILTER_MAX_IDS ids per call,
+    the chunks are fetched concurrently by up to AGENT_STATUS_CONCURRENCY threads."""
+    chunks = [user_ids[i:i + AGENT_FILTER_MAX_IDS] for i in range(0, len(user_ids), AGENT_FILTER_MAX_IDS)]
+    if len(chunks) <= 1:
+        results = [fetch_user_data(user_ids_chunk, instance_id) for user_ids_chunk in chunks]
+    else:
+        with ThreadPoolExecutor(max_workers=min(AGENT_STATUS_CONCURRENCY, len(chunks))) as executor:
+            results = list(executor.map(lambda user_ids_chunk: fetch_user_data(user_ids_chunk, instance_id), chunks))
+    return [user_data for chunk_user_data in results for user_data in chunk_user_data]
+
+
+def fetch_user_data(user_ids_chunk, instance_id):
+    request = {
+        'InstanceId': instance_id,
+        'Filters': {'Agents': user_ids_chunk},
+        'MaxResults': AGENT_FILTER_MAX_IDS
+    }
+    user_data_list = []
+    while True:
+        response = call_with_backoff(connect.get_current_user_data, **request)
+        user_data_list.extend(response.get('UserDataList', []))
+        if not response.get('NextToken'):
+            return user_data_list
+        request['NextToken'] = response['NextToken']
+
+
+def sync_agent_status(user_id_name_dict, user_data_list):
+    """Upserts the agents whose record changed since it was last published, by Agent_Id__c in sObject Collections requests.
+    Agents published on an earlier tick that are missing from user_data_list are upserted once as offline."""
+    sf = get_salesforce()
+    region = get_multi_region(sf)
+    published = get_state_store('agent-status-published', ttl=FULL_REFRESH_SECONDS)
+    # Ids of the agents whose current status is published, kept until they drop out of the snapshot
+    online = get_state_store('agent-status-online')
+    # Digests kept in the container are only current when it also ran the previous tick, shared stores are read again instead
+    if not follows_previous_tick('agent-status', TICK_SECONDS) and not published.shared:
+        logger.info("Previous tick not run by this container, republishing all agents")
+        published.clear()
+
+    records = []
+    for user_data in user_data_list:
+        sObjectData = prepare_record(user_id_name_dict, user_data)
+        sAgentId = user_data['User']['Id']
+        # If Region__c exists from Salesforce org, then multi-region is supported. Need to append the region to the Salesforce Agent Id
+        if region:
+            sObjectData[objectnamespace + 'Region__c'] = region
+            sAgentId = sAgentId + '-' + region
+        records.append((sAgentId, sObjectData))
+
+    current = set(sAgentId for sAgentId, _ in records)
+    previous = set(sAgentId for sAgentId, _ in online.items())
+    gone = sorted(previous - current)
+    try:
+        stats = write_records(sf, AGENT_STATUS_SOBJECT, AGENT_ID_FIELD, records, digests=published, digest=record_digest)
+        online.put_many((sAgentId, True) for sAgentId in current - previous)
+        if gone:
+            offline_stats = write_records(sf, AGENT_STATUS_SOBJECT, AGENT_ID_FIELD, [(sAgentId, prepare_offline_record()) for sAgentId in gone])
+            logger.info("Published %d agents no longer in the user data as offline" % len(gone))
+            stats['written'] += offline_stats['written']
+            for sAgentId in gone:
+                published.delete(sAgentId)
+                online.delete(sAgentId)
+        return stats
+    finally:
+        published.expire()
+        published.flush()
+        online.flush()
+
+
+def record_digest(record):
+    return hashlib.blake2b(json.dumps(record, sort_keys=True).encode('utf-8'), digest_size=16).hexdigest()
+
+
+def get_multi_region(sf):
+    """Returns the region to stamp on records when AC_AgentStatus__c has a Region__c field, the describe is cached for SCHEMA_TTL_SECONDS."""
+    global schema_region, schema_loaded_at
+    if schema_loaded_at is None or time.time() - schema_loaded_at > SCHEMA_TTL_SECONDS:
+        field_mapping = get_field_mapping(sf, AGENT_STATUS_SOBJECT)
+        schema_region = None
+        if (objectnamespace + 'Region__c').lower() in field_mapping:
+            logger.info("Multi-region enabled")
+            schema_region = boto3.session.Session().region_name
+        # A failed describe returns no fields, probe again on the next tick rather than caching it
+        if field_mapping:
+            schema_loaded_at = time.time()
+    return schema_region
+
+
+def prepare_record(user_id_name_dict, user_data):
+    user_id = user_data['User']['Id']
+    status = user_data.get('Status', {})
+    record = {}
+    record['Name'] = user_id_name_dict.get(user_id, user_id)
+    record[objectnamespace + 'Agent_ARN__c'] = user_data['User'].get('Arn', '')
+    record[objectnamespace + 'Status__c'] = status.get('StatusName', '')
+    record[objectnamespace + 'Status_Start_Time__c'] = status['StatusStartTimestamp'].isoformat() if 'StatusStartTimestamp' in status else None
+    record[objectnamespace + 'Next_Status__c'] = user_data.get('NextStatus', '')
+    record[objectnamespace + 'Routing_Profile_Id__c'] = user_data.get('RoutingProfile', {}).get('Id', '')
+    record[objectnamespace + 'Contacts__c'] = len(user_data.get('Contacts', []))
+    record[objectnamespace + 'Active_Slots__c'] = sum(user_data.get('ActiveSlotsByChannel', {}).values())
+    record[objectnamespace + 'Available_Slots__c'] = sum(user_data.get('AvailableSlotsByChannel', {}).values())
+    return record
+
+
+def prepare_offline_record():
+    # Name and Agent_ARN__c are left as last published
+    record = {}
+    record[objectnamespace + 'Status__c'] = OFFLINE_STATUS_NAME
+    record[objectnamespace + 'Status_Start_Time__c'] = None
+    record[objectnamespace + 'Next_Status__c'] = ''
+    record[objectnamespace + 'Routing_Profile_Id__c'] = ''
+    record[objectnamespace + 'Contacts__c'] = 0
+    record[objectnamespace + 'Active_Slots__c'] = 0
+    record[objectnamespace + 'Available_Slots__c'] = 0
+    return record
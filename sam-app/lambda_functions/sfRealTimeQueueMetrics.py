@@ -23,12 +23,19 @@ See the License for the specific language governing permissions and
 limitations under the License.
 """
 
-import json, csv, os
+import json, csv, os, time
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
 import boto3
+from botocore.config import Config
 import urllib.parse
-from salesforce import Salesforce
-from sf_util import get_arg, parse_date, split_bucket_key
-from log_util import logger
+from salesforce import get_salesforce
+from sf_util import get_arg, parse_date, split_bucket_key, get_field_mapping, call_with_backoff
+from sfStateStore import get_state_store
+from sfConnectDirectory import ConnectDirectory
+from sfTickScheduler import is_scheduled_event, scheduled_time, run_ticks, follows_previous_tick
+from sfHashRing import shard_ring
+from log_util import logger, emit_metrics
 
 objectnamespace = os.environ['SF_ADAPTER_NAMESPACE']
 
@@ -40,6 +47,63 @@ else:
 #get connect reference
 connect=boto3.client('connect')
 
+# Current metrics requested for every queue: Connect metric name -> unit, AC_QueueMetrics__c field, default and converter
+METRIC_REGISTRY = {
+    'AGENTS_ONLINE': {'Unit': 'COUNT', 'Field': objectnamespace + 'Agents_Online__c', 'Default': 0, 'Converter': int},
+    'AGENTS_AVAILABLE': {'Unit': 'COUNT', 'Field': objectnamespace + 'Agents_Available__c', 'Default': 0, 'Converter': int},
+    'AGENTS_ON_CONTACT': {'Unit': 'COUNT', 'Field': objectnamespace + 'Agents_On_Call__c', 'Default': 0, 'Converter': int},
+    'AGENTS_STAFFED': {'Unit': 'COUNT', 'Field': objectnamespace + 'Agents_Staffed__c', 'Default': 0, 'Converter': int},
+    'AGENTS_AFTER_CONTACT_WORK': {'Unit': 'COUNT', 'Field': objectnamespace + 'Agents_After_Contact_Work__c', 'Default': 0, 'Converter': int},
+    'AGENTS_NON_PRODUCTIVE': {'Unit': 'COUNT', 'Field': objectnamespace + 'Agents_Non_Productive__c', 'Default': 0, 'Converter': int},
+    'AGENTS_ERROR': {'Unit': 'COUNT', 'Field': objectnamespace + 'Agents_Error__c', 'Default': 0, 'Converter': int},
+    'CONTACTS_IN_QUEUE': {'Unit': 'COUNT', 'Field': objectnamespace + 'Contacts_In_Queue__c', 'Default': 0, 'Converter': int},
+    'OLDEST_CONTACT_AGE': {'Unit': 'SECONDS', 'Field': objectnamespace + 'Oldest_Contact_Age__c', 'Default': 0, 'Converter': int},
+    'CONTACTS_SCHEDULED': {'Unit': 'COUNT', 'Field': objectnamespace + 'Contacts_Scheduled__c', 'Default': 0, 'Converter': int},
+}
+CONVERTERS = {'int': int, 'float': float, 'str': str}
+
+def load_extra_metrics(extra):
+    """Adds the metrics configured in QUEUE_METRICS_EXTRA to the registry, a JSON object such as
+    {"SLOTS_ACTIVE": {"Unit": "COUNT", "Field": "Slots_Active__c", "Default": 0, "Converter": "int"}}.
+    Unit defaults to COUNT, Default to 0 and Converter to int, Field is used as is."""
+    for name, metric in json.loads(extra).items():
+        METRIC_REGISTRY[name] = {
+            'Unit': metric.get('Unit', 'COUNT'),
+            'Field': metric['Field'],
+            'Default': metric.get('Default', 0),
+            'Converter': CONVERTERS[metric.get('Converter', 'int')]
+        }
+
+if os.environ.get('QUEUE_METRICS_EXTRA'):
+    load_extra_metrics(os.environ['QUEUE_METRICS_EXTRA'])
+
+# GetCurrentMetricData accepts at most 100 queue ids in its Queues filter
+QUEUE_FILTER_MAX_IDS = 100
+# Number of queue id chunks fetched concurrently
+METRICS_CONCURRENCY = int(os.environ.get('QUEUE_METRICS_CONCURRENCY', '4'))
+# Seconds the AC_QueueMetrics__c describe is reused by a warm container
+SCHEMA_TTL_SECONDS = int(os.environ.get('SF_SCHEMA_TTL_SECONDS', '3600'))
+schema_region = None
+schema_loaded_at = None
+# Unchanged queues are republished at least this often, so rows edited or lost in Salesforce are repaired
+FULL_REFRESH_SECONDS = int(os.environ.get('QUEUE_METRICS_FULL_REFRESH_SECONDS', '300'))
+# records upserts AC_QueueMetrics__c, events publishes AC_QueueMetrics__e Platform Events and events+records
+# publishes events every tick while persisting records only every RECORD_PERSIST_SECONDS
+OUTPUT_MODES = ('records', 'events', 'events+records')
+OUTPUT_MODE = os.environ.get('QUEUE_METRICS_OUTPUT_MODE', 'records').lower()
+if OUTPUT_MODE not in OUTPUT_MODES:
+    raise Exception("QUEUE_METRICS_OUTPUT_MODE must be one of %s" % ', '.join(OUTPUT_MODES))
+EVENT_SOBJECT = objectnamespace + os.environ.get('QUEUE_METRICS_EVENT', 'AC_QueueMetrics__e')
+RECORD_PERSIST_SECONDS = int(os.environ.get('QUEUE_METRICS_RECORD_PERSIST_SECONDS', '60'))
+records_persisted_at = 0
+queue_directory = None
+# A scheduled invocation refreshes the metrics every TICK_SECONDS until the next one, SCHEDULE_SECONDS later
+TICK_SECONDS = float(os.environ.get('QUEUE_METRICS_TICK_SECONDS', '15'))
+SCHEDULE_SECONDS = float(os.environ.get('QUEUE_METRICS_SCHEDULE_SECONDS', '60'))
+# With more than one shard each tick is fanned out to one worker invocation per shard, queues are assigned by a consistent hash
+SHARDS = int(os.environ.get('QUEUE_METRICS_SHARDS', '1'))
+lambda_client = boto3.client('lambda', config=Config(max_pool_connections=max(10, SHARDS)))
+
 def lambda_handler(event, context):
 
     try:
@@ -47,250 +111,285 @@ def lambda_handler(event, context):
         logger.info(f"boto3 version: {boto3.__version__}")
 
         instance_id = os.environ['AMAZON_CONNECT_INSTANCE_ID']
-        queue_max_result = os.environ['AMAZON_CONNECT_QUEUE_MAX_RESULT']
         logger.info(f"instance id: {instance_id}")
-        next_token = 'NoToken'
-
-        while len(next_token)!=0:
-            if next_token == 'NoToken':
-                queues_data = connect.list_queues(InstanceId=instance_id,QueueTypes=['STANDARD'],MaxResults=int(queue_max_result))
-            else:
-                queues_data = connect.list_queues(InstanceId=instance_id,QueueTypes=['STANDARD'],MaxResults=int(queue_max_result), NextToken=next_token)
-
-            logger.info(f"queues_data: {queues_data}")
-            if 'QueueSummaryList' in queues_data.keys():
-                queue_summary = queues_data['QueueSummaryList']
-                logger.info(f"QueueSummaryList: {queue_summary}")
-            else:
-                queue_summary=[]
-                logger.info("QueueSummaryList key is Not present")
-
-            if 'NextToken' in queues_data.keys():
-                next_token = queues_data['NextToken']
-                logger.info(f"next_token: {next_token}")
-            else:
-                next_token=''
-                logger.info("NextToken key is Not present")
-
-            if len(queue_summary) !=0:
-                logger.info(f"Items in queue List: {len(queue_summary)}")
-                queue_ids =[]
-                queue_id_name_dict ={}
-                for dict_item in queue_summary:
-                    queue_ids.append(dict_item['Id'])
-                    queue_id_name_dict[dict_item['Id']] = dict_item['Name']
-                logger.info(f"Queue_dict map: {queue_id_name_dict}")
-                ac_queue_metrics(queue_id_name_dict,queue_ids,instance_id)
+
+        if 'shard' in event:
+            # Worker invocation of a sharded tick
+            return sync_tick(instance_id, event['shard'], event['shards'])
+
+        tick = (lambda: coordinate_tick(context)) if SHARDS > 1 else (lambda: sync_tick(instance_id))
+        if is_scheduled_event(event):
+            ticks = run_ticks(tick, TICK_SECONDS, SCHEDULE_SECONDS, context, scheduled_at=scheduled_time(event))
+            logger.info(f"Ran {ticks} ticks")
+        else:
+            tick()
 
     except Exception as e:
         raise e
 
 
+def sync_tick(instance_id, shard=None, shards=None):
+    """Syncs the metrics of every queue, or of the queues the consistent hash ring assigns to shard. Returns the tick timings."""
+    started = time.time()
+    if not follows_previous_tick('queue-metrics-shard-' + str(shard), TICK_SECONDS):
+        forget_published(shard)
+    queue_id_name_dict = get_queue_directory(instance_id).entries()
+    if shard is not None:
+        ring = shard_ring(shards)
+        queue_id_name_dict = {queue_id: name for queue_id, name in queue_id_name_dict.items() if ring.node_for(queue_id) == shard}
+    if len(queue_id_name_dict) == 0:
+        logger.info("No queues to sync")
+        return {'shard': shard, 'queues': 0, 'latency': int((time.time() - started) * 1000)}
+
+    snapshots = ac_queue_metrics(queue_id_name_dict, list(queue_id_name_dict.keys()), instance_id)
+    fetched = time.time()
+    sync_queue_metrics(queue_id_name_dict, snapshots, shard)
+    latency = int((time.time() - started) * 1000)
+    emit_metrics({
+        'MetricsFetchLatency': (int((fetched - started) * 1000), 'Milliseconds'),
+        'TickLatency': (latency, 'Milliseconds'),
+        'Queues': len(snapshots)
+    })
+    return {'shard': shard, 'queues': len(snapshots), 'latency': latency}
+
+
+def coordinate_tick(context):
+    """Invokes one worker per shard concurrently and waits for all of them, the timings of every shard are logged and emitted."""
+    started = time.time()
+
+    def invoke_shard(shard):
+        response = lambda_client.invoke(FunctionName=context.invoked_function_arn, InvocationType='RequestResponse',
+            Payload=json.dumps({'shard': shard, 'shards': SHARDS}))
+        payload = json.loads(response['Payload'].read() or 'null')
+        if 'FunctionError' in response:
+            raise Exception(f"Shard {shard} failed: {payload}")
+        return payload
+
+    with ThreadPoolExecutor(max_workers=SHARDS) as executor:
+        futures = [executor.submit(invoke_shard, shard) for shard in range(SHARDS)]
+    errors = []
+    for future in futures:
+        try:
+            timing = future.result()
+            logger.info(f"Shard {timing['shard']}: {timing['queues']} queues in {timing['latency']} ms")
+            emit_metrics({'ShardTickLatency': (timing['latency'], 'Milliseconds'), 'ShardQueues': timing['queues']}, {'Shard': str(timing['shard'])})
+        except Exception as e:
+            logger.error(str(e))
+            errors.append(e)
+    emit_metrics({'TickLatency': (int((time.time() - started) * 1000), 'Milliseconds'), 'ShardsFailed': len(errors)})
+    if errors:
+        raise errors[0]
+
+
+def get_queue_directory(instance_id):
+    global queue_directory
+    if queue_directory is None:
+        queue_directory = ConnectDirectory('queues-' + instance_id, lambda next_token: list_queues(instance_id, next_token))
+    return queue_directory
+
+
+def list_queues(instance_id, next_token=None):
+    """Returns one page of the standard queues of the instance and the token of the next page, the loader of the queue directory."""
+    queue_max_result = os.environ['AMAZON_CONNECT_QUEUE_MAX_RESULT']
+    request = {'InstanceId': instance_id, 'QueueTypes': ['STANDARD'], 'MaxResults': int(queue_max_result)}
+    if next_token:
+        request['NextToken'] = next_token
+    queues_data = connect.list_queues(**request)
+
+    queue_id_name_dict = {}
+    for dict_item in queues_data.get('QueueSummaryList', []):
+        queue_id_name_dict[dict_item['Id']] = dict_item['Name']
+    logger.info(f"Items in queue page: {len(queue_id_name_dict)}")
+    return queue_id_name_dict, queues_data.get('NextToken')
+
+
 def ac_queue_metrics(queue_id_name_dict,queue_ids, instance_id):
+    """Returns the current metrics snapshot of every queue. The Queues filter accepts at most QUEUE_FILTER_MAX_IDS ids per call,
+    the chunks are fetched concurrently by up to METRICS_CONCURRENCY threads."""
     try:
 
         logger.info("Start ac_queue_metrics")
         logger.info(f"Queues : {queue_ids}")
-        next_token = 'NoToken'
-
-        queuemetics_max_result = os.environ['AMAZON_CONNECT_QUEUEMETRICS_MAX_RESULT']
-        current_metrics = [
-                    { 'Name': 'AGENTS_ONLINE', 'Unit': 'COUNT' },
-                    { 'Name': 'AGENTS_AVAILABLE', 'Unit': 'COUNT' },
-                    { 'Name': 'AGENTS_ON_CONTACT', 'Unit': 'COUNT' },
-                    { 'Name': 'AGENTS_STAFFED', 'Unit': 'COUNT' },
-                    { 'Name': 'AGENTS_AFTER_CONTACT_WORK', 'Unit': 'COUNT' },
-                    { 'Name': 'AGENTS_NON_PRODUCTIVE', 'Unit': 'COUNT' },
-                    { 'Name': 'AGENTS_ERROR', 'Unit': 'COUNT' },
-                    { 'Name': 'CONTACTS_IN_QUEUE', 'Unit': 'COUNT' },
-                    { 'Name': 'OLDEST_CONTACT_AGE', 'Unit': 'SECONDS' },
-                    { 'Name': 'CONTACTS_SCHEDULED', 'Unit': 'COUNT' },
-                ]
-
-        while len(next_token)!=0:
-            if next_token == 'NoToken':
-                logger.info("Call QueueMetric : without no token")
-                currentMetrics_data = connect.get_current_metric_data(InstanceId = instance_id,
-                    Filters = {'Channels': ['VOICE', 'CHAT', 'TASK'], 'Queues': queue_ids},
-                    Groupings = ['QUEUE'],
-                    CurrentMetrics = current_metrics,
-                    MaxResults = int(queuemetics_max_result)
-                    )
-            else:
-                logger.info("Call QueueMetric : with token")
-                currentMetrics_data = connect.get_current_metric_data(InstanceId = instance_id,
-                    Filters = {'Channels': ['VOICE', 'CHAT', 'TASK'], 'Queues': queue_ids},
-                    Groupings = ['QUEUE'],
-                    CurrentMetrics = current_metrics,
-                    MaxResults = int(queuemetics_max_result),
-                    NextToken = next_token
-                    )
-            logger.info(f"currentMetrics_data: {currentMetrics_data}")
-
-            if 'NextToken' in currentMetrics_data.keys():
-                next_token = currentMetrics_data['NextToken']
-                logger.info(f"NextToken: {next_token}")
-            else:
-                next_token=''
-                logger.info("NextToke key is Not present")
-
-            if 'MetricResults' in currentMetrics_data.keys():
-                metricresults_data = currentMetrics_data['MetricResults']
-                logger.info(f"metricresults_data: {metricresults_data}")
-            else:
-                metricresults_data=[]
-                logger.info("MetricResults key is Not present")
-
-            i =0
-
-
-            sf = Salesforce()
-
-            if len(metricresults_data) !=0:
-                while i < len(metricresults_data):
-                    queue_metics_data_dict ={}
-                    data = metricresults_data[i]
-                    logger.info('*********')
-                    logger.info(f'Data : {i} ***  {data}')
-                    if 'Dimensions' in data.keys():
-                        dimensions_data = data['Dimensions']
-                        if 'Queue' in dimensions_data.keys():
-                            queue_data = dimensions_data['Queue']
-                            queue_metics_data_dict['queue_id'] = queue_data['Id']
-                            queue_metics_data_dict['queue_arn'] = queue_data['Arn']
-                            logger.info(f"queue id : {queue_data['Id']}")
-                            logger.info(f"queue ARN : {queue_data['Arn']}")
-                            logger.info('*********')
-                            logger.info('*********')
-
-                    if 'Collections' in data.keys():
-                        collections_data = data['Collections']
-                        logger.info(f'collections_data : {i} ***  {collections_data}')
-                        j = 0
-                        while j < len(collections_data):
-                            logger.info(f"J : {j}")
-                            metrics_data = collections_data[j]
-                            logger.info(metrics_data)
-
-                            if 'Metric' in metrics_data.keys():
-                                metric_data = metrics_data['Metric']
-                                if metric_data['Name'] == 'AGENTS_ONLINE' and 'Value' in metrics_data.keys() :
-                                    agent_online = int(metrics_data['Value'])
-                                    queue_metics_data_dict['agent_online'] = agent_online
-                                elif metric_data['Name'] == 'AGENTS_AVAILABLE' and 'Value' in metrics_data.keys() :
-                                    agent_available = int(metrics_data['Value'])
-                                    queue_metics_data_dict['agent_available'] = agent_available
-                                elif metric_data['Name'] == 'AGENTS_ON_CONTACT' and 'Value' in metrics_data.keys() :
-                                    agent_on_call = int(metrics_data['Value'])
-                                    queue_metics_data_dict['agent_on_call'] = agent_on_call
-                                elif metric_data['Name'] == 'AGENTS_STAFFED' and 'Value' in metrics_data.keys() :
-                                    agent_staffed = int(metrics_data['Value'])
-                                    queue_metics_data_dict['agent_staffed'] = agent_staffed
-                                elif metric_data['Name'] == 'AGENTS_AFTER_CONTACT_WORK' and 'Value' in metrics_data.keys() :
-                                    agent_awc = int(metrics_data['Value'])
-                                    queue_metics_data_dict['agent_awc'] = agent_awc
-                                elif metric_data['Name'] == 'AGENTS_NON_PRODUCTIVE' and 'Value' in metrics_data.keys() :
-                                    agent_non_productive = int(metrics_data['Value'])
-                                    queue_metics_data_dict['agent_non_productive'] = agent_non_productive
-                                elif metric_data['Name'] == 'AGENTS_ERROR' and 'Value' in metrics_data.keys() :
-                                    agent_error = int(metrics_data['Value'])
-                                    queue_metics_data_dict['agent_error'] = agent_error
-                                elif metric_data['Name'] == 'CONTACTS_IN_QUEUE' and 'Value' in metrics_data.keys() :
-                                    contacts_in_queue = int(metrics_data['Value'])
-                                    queue_metics_data_dict['contacts_in_queue'] = contacts_in_queue
-                                elif metric_data['Name'] == 'OLDEST_CONTACT_AGE' and 'Value' in metrics_data.keys() :
-                                    oldest_contact_age = int(metrics_data['Value'])
-                                    queue_metics_data_dict['oldest_contact_age'] = oldest_contact_age
-                                elif metric_data['Name'] == 'CONTACTS_SCHEDULED' and 'Value' in metrics_data.keys() :
-                                    contacts_scheduled = int(metrics_data['Value'])
-                                    queue_metics_data_dict['contacts_scheduled'] = contacts_scheduled
-                            j = j + 1
-
-                        sObjectData = prepare_record(queue_id_name_dict,queue_metics_data_dict)
-                        sQueueId = queue_metics_data_dict['queue_id']
-                        # If Region__c exists from Salesforce org, then multi-region is supported. Need to append the region to the Salesforce Queue Id
-                        if sf.isFieldInSObject(objectnamespace + 'AC_QueueMetrics__c', objectnamespace + 'Region__c'):
-                            logger.info("Multi-region enabled")
-                            session = boto3.session.Session()
-                            sObjectData[objectnamespace + 'Region__c'] = session.region_name
-                            sQueueId = sQueueId + '-' + session.region_name
-
-                        sf.update_by_external(objectnamespace + "AC_QueueMetrics__c", objectnamespace + 'Queue_Id__c', sQueueId, sObjectData)
-
-                        i = i + 1
-
-            logger.info("End ac_queue_metrics method")
-
-    except Exception as e:
-        raise e
-
-
-def prepare_record(queue_id_name_dict,queue_metric_data):
-    logger.info("prepare record method")
-    logger.info(f"Queue Name: {queue_id_name_dict[queue_metric_data['queue_id']]}")
-    logger.info(f"Print data : {queue_metric_data}")
-    record = {}
-    record['Name'] = queue_id_name_dict[queue_metric_data['queue_id']]
-    if 'queue_id' in queue_metric_data.keys():
 
-        if 'queue_arn' in queue_metric_data.keys():
-            record[objectnamespace + 'Queue_ARN__c'] = queue_metric_data['queue_arn']
+        chunks = [queue_ids[i:i + QUEUE_FILTER_MAX_IDS] for i in range(0, len(queue_ids), QUEUE_FILTER_MAX_IDS)]
+        if len(chunks) <= 1:
+            results = [fetch_queue_metrics(queue_ids_chunk, instance_id) for queue_ids_chunk in chunks]
         else:
-            record[objectnamespace + 'Queue_ARN__c'] = ''
+            with ThreadPoolExecutor(max_workers=min(METRICS_CONCURRENCY, len(chunks))) as executor:
+                results = list(executor.map(lambda queue_ids_chunk: fetch_queue_metrics(queue_ids_chunk, instance_id), chunks))
 
+        snapshots = [snapshot for chunk_snapshots in results for snapshot in chunk_snapshots]
+        logger.info("End ac_queue_metrics method")
+        return snapshots
 
-        if 'agent_awc' in queue_metric_data.keys():
-            record[objectnamespace + 'Agents_After_Contact_Work__c'] = queue_metric_data['agent_awc']
-        else:
-            record[objectnamespace + 'Agents_After_Contact_Work__c'] = 0
+    except Exception as e:
+        raise e
 
-        if 'agent_available' in queue_metric_data.keys():
-            record[objectnamespace + 'Agents_Available__c'] = queue_metric_data['agent_available']
-        else:
-            record[objectnamespace + 'Agents_Available__c'] = 0
 
-        if 'agent_error' in queue_metric_data.keys():
-            record[objectnamespace + 'Agents_Error__c'] = queue_metric_data['agent_error']
+def fetch_queue_metrics(queue_ids_chunk, instance_id):
+    queuemetics_max_result = os.environ['AMAZON_CONNECT_QUEUEMETRICS_MAX_RESULT']
+    current_metrics = [{ 'Name': name, 'Unit': metric['Unit'] } for name, metric in METRIC_REGISTRY.items()]
+    snapshots = []
+    request = {
+        'InstanceId': instance_id,
+        'Filters': {'Channels': ['VOICE', 'CHAT', 'TASK'], 'Queues': queue_ids_chunk},
+        'Groupings': ['QUEUE'],
+        'CurrentMetrics': current_metrics,
+        'MaxResults': int(queuemetics_max_result)
+    }
+    next_token = 'NoToken'
+
+    while len(next_token)!=0:
+        if next_token == 'NoToken':
+            logger.info("Call QueueMetric : without no token")
+            currentMetrics_data = call_with_backoff(connect.get_current_metric_data, **request)
         else:
-            record[objectnamespace + 'Agents_Error__c'] = 0
+            logger.info("Call QueueMetric : with token")
+            currentMetrics_data = call_with_backoff(connect.get_current_metric_data, NextToken=next_token, **request)
+        logger.info(f"currentMetrics_data: {currentMetrics_data}")
 
-        if 'agent_non_productive' in queue_metric_data.keys():
-            record[objectnamespace + 'Agents_Non_Productive__c'] = queue_metric_data['agent_non_productive']
+        if 'NextToken' in currentMetrics_data.keys():
+            next_token = currentMetrics_data['NextToken']
+            logger.info(f"NextToken: {next_token}")
         else:
-            record[objectnamespace + 'Agents_Non_Productive__c'] = 0
+            next_token=''
+            logger.info("NextToke key is Not present")
 
-        if 'agent_on_call' in queue_metric_data.keys():
-            record[objectnamespace + 'Agents_On_Call__c'] = queue_metric_data['agent_on_call']
+        if 'MetricResults' in currentMetrics_data.keys():
+            metricresults_data = currentMetrics_data['MetricResults']
+            logger.info(f"metricresults_data: {metricresults_data}")
         else:
-            record[objectnamespace + 'Agents_On_Call__c'] = 0
-
-        if 'agent_online' in queue_metric_data.keys():
-            record[objectnamespace + 'Agents_Online__c'] = queue_metric_data['agent_online']
+            metricresults_data=[]
+            logger.info("MetricResults key is Not present")
+
+        snapshots.extend(decode_metric_results(metricresults_data))
+
+    return snapshots
+
+
+def decode_metric_results(metricresults_data):
+    snapshots = []
+    for data in metricresults_data:
+        queue_data = data.get('Dimensions', {}).get('Queue')
+        if queue_data is None:
+            continue
+        queue_metics_data_dict = {'queue_id': queue_data['Id'], 'queue_arn': queue_data['Arn']}
+        for metrics_data in data.get('Collections', []):
+            name = metrics_data['Metric']['Name']
+            if name in METRIC_REGISTRY and 'Value' in metrics_data:
+                queue_metics_data_dict[name] = METRIC_REGISTRY[name]['Converter'](metrics_data['Value'])
+        snapshots.append(queue_metics_data_dict)
+    return snapshots
+
+
+def sync_queue_metrics(queue_id_name_dict, snapshots, shard=None):
+    """Sends the snapshots of a tick to Salesforce in OUTPUT_MODE, the object schema is probed once.
+    Records are upserted by Queue_Id__c with sObject Collections requests and events are published in batches through the same endpoint.
+    Queues whose data is unchanged since it was last sent are skipped until FULL_REFRESH_SECONDS have passed."""
+    global records_persisted_at
+    sf = get_salesforce()
+    region = get_multi_region(sf)
+
+    records = []
+    for queue_metics_data_dict in snapshots:
+        sObjectData = prepare_record(queue_id_name_dict,queue_metics_data_dict)
+        sQueueId = queue_metics_data_dict['queue_id']
+        # If Region__c exists from Salesforce org, then multi-region is supported. Need to append the region to the Salesforce Queue Id
+        if region:
+            sObjectData[objectnamespace + 'Region__c'] = region
+            sQueueId = sQueueId + '-' + region
+        sObjectData[objectnamespace + 'Queue_Id__c'] = sQueueId
+        records.append(sObjectData)
+
+    results = []
+    if OUTPUT_MODE != 'records':
+        events = [prepare_event(record) for record in records]
+        results = publish_changed('events', events, lambda changed: sf.create_collection(EVENT_SOBJECT, changed), shard)
+    if OUTPUT_MODE == 'records' or time.time() - records_persisted_at >= RECORD_PERSIST_SECONDS:
+        results = publish_changed('records', records, lambda changed: sf.upsert_collection(objectnamespace + "AC_QueueMetrics__c", objectnamespace + 'Queue_Id__c', changed), shard)
+        records_persisted_at = time.time()
+    return results
+
+
+def get_published_store(output, shard=None):
+    """Returns the digests of the records of output last sent by shard, their TTL forces the periodic full refresh.
+    Each shard keeps its own store so workers sharing an S3 store do not overwrite each other."""
+    namespace = 'queue-metrics-published' if output == 'records' else 'queue-metrics-published-' + output
+    if shard is not None:
+        namespace = namespace + '-shard-' + str(shard)
+    return get_state_store(namespace, ttl=FULL_REFRESH_SECONDS)
+
+
+def forget_published(shard=None):
+    """Clears the digests kept in this container, used when another container may have sent the shard since.
+    Shared stores are read again whenever they are fetched and are kept."""
+    for output in OUTPUT_MODE.split('+'):
+        published = get_published_store(output, shard)
+        if not published.shared:
+            logger.info(f"Previous tick not run by this container, republishing all queue metrics {output}")
+            published.clear()
+
+
+def publish_changed(output, records, send, shard=None):
+    """Calls send with the records whose digest changed since they were last sent and returns its results.
+    The digests of records sent successfully are kept in the published store of the output and shard."""
+    published = get_published_store(output, shard)
+
+    changed = []
+    digests = []
+    for record in records:
+        digest = record_digest(record)
+        if published.get(record[objectnamespace + 'Queue_Id__c']) != digest:
+            changed.append(record)
+            digests.append(digest)
+
+    results = send(changed) if changed else []
+    failed = 0
+    for record, digest, result in zip(changed, digests, results):
+        if result['success']:
+            published.put(record[objectnamespace + 'Queue_Id__c'], digest)
         else:
-            record[objectnamespace + 'Agents_Online__c'] = 0
+            failed = failed + 1
+            logger.error(f"Failed to send queue metrics {output} {record[objectnamespace + 'Queue_Id__c']}: {result['errors']}")
+    published.expire()
+    published.flush()
 
-        if 'agent_staffed' in queue_metric_data.keys():
-            record[objectnamespace + 'Agents_Staffed__c'] = queue_metric_data['agent_staffed']
-        else:
-            record[objectnamespace + 'Agents_Staffed__c'] = 0
+    suppressed = len(records) - len(changed)
+    logger.info(f"Sent {len(changed) - failed} queue metrics {output}, {failed} failed, {suppressed} unchanged")
+    emit_metrics({'QueuesPublished': len(changed) - failed, 'QueuesFailed': failed, 'QueuesSuppressed': suppressed}, {'Output': output})
+    return results
 
-        if 'contacts_in_queue' in queue_metric_data.keys():
-            record[objectnamespace + 'Contacts_In_Queue__c'] = queue_metric_data['contacts_in_queue']
-        else:
-            record[objectnamespace + 'Contacts_In_Queue__c'] = 0
 
-        if 'contacts_scheduled' in queue_metric_data.keys():
-            record[objectnamespace + 'Contacts_Scheduled__c'] = queue_metric_data['contacts_scheduled']
-        else:
-            record[objectnamespace + 'Contacts_Scheduled__c'] = 0
+def prepare_event(record):
+    # Platform Events have no Name field, the queue name is sent in Queue_Name__c
+    event = {field: value for field, value in record.items() if field != 'Name'}
+    event[objectnamespace + 'Queue_Name__c'] = record['Name']
+    return event
 
-        if 'oldest_contact_age' in queue_metric_data.keys():
-            record[objectnamespace + 'Oldest_Contact_Age__c'] = queue_metric_data['oldest_contact_age']
-        else:
-            record[objectnamespace + 'Oldest_Contact_Age__c'] = 0
+
+def record_digest(record):
+    return hashlib.blake2b(json.dumps(record, sort_keys=True).encode('utf-8'), digest_size=16).hexdigest()
 
 
+def get_multi_region(sf):
+    """Returns the region to stamp on records when AC_QueueMetrics__c has a Region__c field, the describe is cached for SCHEMA_TTL_SECONDS."""
+    global schema_region, schema_loaded_at
+    if schema_loaded_at is None or time.time() - schema_loaded_at > SCHEMA_TTL_SECONDS:
+        field_mapping = get_field_mapping(sf, objectnamespace + 'AC_QueueMetrics__c')
+        schema_region = None
+        if (objectnamespace + 'Region__c').lower() in field_mapping:
+            logger.info("Multi-region enabled")
+            schema_region = boto3.session.Session().region_name
+        # A failed describe returns no fields, probe again on the next tick rather than caching it
+        if field_mapping:
+            schema_loaded_at = time.time()
+    return schema_region
 
-    logger.info(f"record data : {record}")
 
-    return record
\ No newline at end of file
+def prepare_record(queue_id_name_dict,queue_metric_data):
+    record = {}
+    record['Name'] = queue_id_name_dict[queue_metric_data['queue_id']]
+    record[objectnamespace + 'Queue_ARN__c'] = queue_metric_data.get('queue_arn', '')
+    for name, metric in METRIC_REGISTRY.items():
+        record[metric['Field']] = queue_metric_data.get(name, metric['Default'])
+    return record
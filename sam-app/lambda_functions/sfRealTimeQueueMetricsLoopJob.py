@@ -1,78 +0,0 @@
-"""
-You must have an AWS account to use the Amazon Connect CTI Adapter.
-Downloading and/or using the Amazon Connect CTI Adapter is subject to the terms of the AWS Customer Agreement,
-AWS Service Terms, and AWS Privacy Notice.
-
-© 2017, Amazon Web Services, Inc. or its affiliates. All rights reserved.
-
-NOTE:  Other license terms may apply to certain, identified software components
-contained within or distributed with the Amazon Connect CTI Adapter if such terms are
-included in the LibPhoneNumber-js and Salesforce Open CTI. For such identified components,
-such other license terms will then apply in lieu of the terms above.
-
-Licensed under the Apache License, Version 2.0 (the "License");
-you may not use this file except in compliance with the License.
-You may obtain a copy of the License at
-
-    http://www.apache.org/licenses/LICENSE-2.0
-
-Unless required by applicable law or agreed to in writing, software
-distributed under the License is distributed on an "AS IS" BASIS,
-WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
-See the License for the specific language governing permissions and
-limitations under the License.
-"""
-
-"""
-You must have an AWS account to use the Amazon Connect CTI Adapter.
-Downloading and/or using the Amazon Connect CTI Adapter is subject to the terms of the AWS Customer Agreement,
-AWS Service Terms, and AWS Privacy Notice.
-
-© 2017, Amazon Web Services, Inc. or its affiliates. All rights reserved.
-
-NOTE:  Other license terms may apply to certain, identified software components
-contained within or distributed with the Amazon Connect CTI Adapter if such terms are
-included in the LibPhoneNumber-js and Salesforce Open CTI. For such identified components,
-such other license terms will then apply in lieu of the terms above.
-
-Licensed under the Apache License, Version 2.0 (the "License");
-you may not use this file except in compliance with the License.
-You may obtain a copy of the License at
-
-    http://www.apache.org/licenses/LICENSE-2.0
-
-Unless required by applicable law or agreed to in writing, software
-distributed under the License is distributed on an "AS IS" BASIS,
-WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
-See the License for the specific language governing permissions and
-limitations under the License.
-"""
-
-import boto3
-import os
-from log_util import logger
-
-client = boto3.client('lambda')
-
-
-def lambda_handler(event, context):
-    logger.info("Start Execution : RealTimeMetricsLoopJob")
-    logger.info(f"Current event : {event}")
-    index = event['iterator']['index'] + 1
-
-    lambdaArn = os.environ['SFDC_REALTIME_QUEUE_METRICS_LAMBDA']
-    logger.info(f"lambdaArn : {lambdaArn}")
-    if not lambdaArn:
-        logger.info("SFDC_REALTIME_QUEUE_METRICS_LAMBDA is empty")
-        return
-
-    response = client.invoke(
-        FunctionName=lambdaArn,
-        InvocationType='Event')
-
-    return {
-        'index': index,
-        'continue': index < event['iterator']['count'],
-        'count': event['iterator']['count']
-    }
-
@@ -0,0 +1,343 @@
+"""
+You must have an AWS account to use the Amazon Connect CTI Adapter.
+Downloading and/or using the Amazon Connect CTI Adapter is subject to the terms of the AWS Customer Agreement,
+AWS Service Terms, and AWS Privacy Notice.
+
+© 2017, Amazon Web Services, Inc. or its affiliates. All rights reserved.
+
+NOTE:  Other license terms may apply to certain, identified software components
+contained within or distributed with the Amazon Connect CTI Adapter if such terms are
+included in the LibPhoneNumber-js and Salesforce Open CTI. For such identified components,
+such other license terms will then apply in lieu of the terms above.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import json, os, threading, time
+import boto3
+from concurrent.futures import ThreadPoolExecutor
+from botocore.config import Config
+from botocore.exceptions import ClientError
+from sf_util import split_s3_bucket_key
+from log_util import logger, sanitize_log
+
+# Location of shared state, s3://bucket/prefix keeps state across containers, memory or a /tmp directory keep it per container
+STATE_STORE_URI = os.environ.get('SF_STATE_STORE_URI', '')
+DEFAULT_STATE_DIR = '/tmp'
+# Attempts to write an S3 store whose object was changed concurrently
+S3_STORE_FLUSH_MAX_ATTEMPTS = int(os.environ.get('SF_STATE_STORE_FLUSH_MAX_ATTEMPTS', '5'))
+# Entries of a per key S3 store read or written concurrently by get_many and put_many
+S3_STORE_CONCURRENCY = int(os.environ.get('SF_STATE_STORE_CONCURRENCY', '16'))
+# Returned when a conditional request loses against another writer, or finds the object unchanged
+CONFLICT_ERROR_CODES = ('PreconditionFailed', 'ConditionalRequestConflict', '412', '409')
+NOT_MODIFIED_ERROR_CODES = ('NotModified', '304')
+NOT_FOUND_ERROR_CODES = ('NoSuchKey', '404', 'NotFound')
+
+class MemoryStore:
+  """Key/value state kept for the lifetime of the container. Entries older than ttl seconds are dropped."""
+  # Whether other containers see the same state
+  shared = False
+
+  def __init__(self, ttl=None):
+    self.ttl = ttl
+    self.entries = {}
+    self.dirty = False
+    self.lock = threading.Lock()
+
+  def get(self, key, default=None):
+    entry = self.entries.get(key)
+    if entry is None or (self.ttl and entry[1] < time.time() - self.ttl):
+      return default
+    return entry[0]
+
+  def put(self, key, value):
+    with self.lock:
+      self.entries[key] = [value, time.time()]
+      self.dirty = True
+
+  def delete(self, key):
+    with self.lock:
+      if self.entries.pop(key, None) is not None:
+        self.dirty = True
+
+  def get_many(self, keys, default=None):
+    return {key: self.get(key, default) for key in keys}
+
+  def put_many(self, items):
+    for key, value in items:
+      self.put(key, value)
+
+  def clear(self):
+    with self.lock:
+      self.dirty = self.dirty or bool(self.entries)
+      self.entries = {}
+
+  def items(self):
+    return [(key, entry[0]) for key, entry in list(self.entries.items()) if not self.ttl or entry[1] >= time.time() - self.ttl]
+
+  def expire(self):
+    if not self.ttl:
+      return
+    oldest = time.time() - self.ttl
+    with self.lock:
+      expired = [key for key, entry in self.entries.items() if entry[1] < oldest]
+      for key in expired:
+        del self.entries[key]
+      self.dirty = self.dirty or bool(expired)
+
+  def refresh(self):
+    pass
+
+  def flush(self):
+    self.dirty = False
+
+class FileStore(MemoryStore):
+  """Key/value state persisted as a JSON file, on Lambda /tmp survives for the lifetime of the execution environment."""
+
+  def __init__(self, path, ttl=None):
+    super().__init__(ttl)
+    self.path = path
+    try:
+      with open(path) as state_file:
+        self.entries = json.load(state_file)
+    except (OSError, ValueError):
+      self.entries = {}
+    self.expire()
+
+  def flush(self):
+    if not self.dirty:
+      return
+    with self.lock:
+      temp_path = '%s.%d.tmp' % (self.path, threading.get_ident())
+      with open(temp_path, 'w') as state_file:
+        json.dump(self.entries, state_file)
+      os.replace(temp_path, self.path)
+      self.dirty = False
+
+class S3Store(MemoryStore):
+  """Key/value state persisted as one JSON object in S3, shared by every container using the same key. Suits small stores.
+  The object is read again when the store is fetched and written back only if it is unchanged since. When another container
+  wrote it in the meantime, entries changed by both are dropped rather than overwritten, so they are published again."""
+
+  def __init__(self, bucket, key, ttl=None):
+    super().__init__(ttl)
+    self.s3 = boto3.client('s3')
+    self.bucket = bucket
+    self.key = key
+    self.etag = None
+    # Entries as last read from or written to S3, and the keys changed locally since
+    self.loaded = {}
+    self.changed = set()
+    self.refresh()
+
+  def put(self, key, value):
+    super().put(key, value)
+    with self.lock:
+      self.changed.add(key)
+
+  def delete(self, key):
+    super().delete(key)
+    with self.lock:
+      self.changed.add(key)
+
+  def read(self, etag=None):
+    """Returns the entries and ETag of the object, or None when its ETag still matches etag."""
+    conditions = {'IfNoneMatch': etag} if etag else {}
+    try:
+      response = self.s3.get_object(Bucket=self.bucket, Key=self.key, **conditions)
+    except ClientError as e:
+      code = error_code(e)
+      if code in NOT_MODIFIED_ERROR_CODES:
+        return None
+      if code in NOT_FOUND_ERROR_CODES:
+        return {}, None
+      raise e
+    return json.loads(response['Body'].read()), response['ETag']
+
+  def refresh(self):
+    state = self.read(self.etag)
+    if state is not None:
+      self.rebase(*state)
+
+  def rebase(self, entries, etag):
+    """Replaces the entries with the ones read from S3 and applies the local changes on top. A change is dropped when the
+    entry also changed in S3 since it was read, neither writer knows which value reached Salesforce last."""
+    with self.lock:
+      merged = dict(entries)
+      for key in self.changed:
+        if entries.get(key) != self.loaded.get(key):
+          merged.pop(key, None)
+        elif key in self.entries:
+          merged[key] = self.entries[key]
+        else:
+          merged.pop(key, None)
+      self.loaded = entries
+      self.entries = merged
+      self.etag = etag
+      self.dirty = bool(self.changed)
+    self.expire()
+
+  def flush(self):
+    for attempt in range(S3_STORE_FLUSH_MAX_ATTEMPTS):
+      with self.lock:
+        if not self.dirty:
+          return
+        body = json.dumps(self.entries)
+        conditions = {'IfMatch': self.etag} if self.etag else {'IfNoneMatch': '*'}
+      try:
+        response = self.s3.put_object(Bucket=self.bucket, Key=self.key, Body=body, ContentType='application/json', **conditions)
+      except ClientError as e:
+        if error_code(e) not in CONFLICT_ERROR_CODES or attempt == S3_STORE_FLUSH_MAX_ATTEMPTS - 1:
+          raise e
+        logger.info("State store changed concurrently, merging: %s" % sanitize_log(self.key))
+        self.rebase(*self.read())
+        continue
+      with self.lock:
+        self.loaded = json.loads(body)
+        self.etag = response['ETag']
+        self.changed = set()
+        self.dirty = False
+      return
+
+class S3PrefixStore:
+  """Key/value state kept as one JSON object per key under an S3 prefix, entries are read and written on access and only
+  the ETags of the entries read since the last flush are held in memory. Writes are conditional on the ETag that was read,
+  an entry another writer changed in the meantime is deleted so it is published again rather than trusted.
+  Entries older than ttl seconds are ignored but not removed, add an S3 lifecycle rule expiring the prefix."""
+  shared = True
+
+  def __init__(self, bucket, prefix, ttl=None):
+    self.ttl = ttl
+    self.s3 = boto3.client('s3', config=Config(max_pool_connections=max(10, S3_STORE_CONCURRENCY)))
+    self.bucket = bucket
+    self.prefix = prefix
+    # ETag of every entry read since the last flush, None when the entry did not exist
+    self.etags = {}
+    self.lock = threading.Lock()
+
+  def get(self, key, default=None):
+    try:
+      response = self.s3.get_object(Bucket=self.bucket, Key=self.prefix + key)
+    except ClientError as e:
+      if error_code(e) not in NOT_FOUND_ERROR_CODES:
+        raise e
+      with self.lock:
+        self.etags[key] = None
+      return default
+    with self.lock:
+      self.etags[key] = response['ETag']
+    if self.ttl and response['LastModified'].timestamp() < time.time() - self.ttl:
+      return default
+    return json.loads(response['Body'].read())
+
+  def put(self, key, value):
+    with self.lock:
+      conditions = {}
+      if key in self.etags:
+        etag = self.etags.pop(key)
+        conditions = {'IfMatch': etag} if etag else {'IfNoneMatch': '*'}
+    try:
+      self.s3.put_object(Bucket=self.bucket, Key=self.prefix + key, Body=json.dumps(value), ContentType='application/json', **conditions)
+    except ClientError as e:
+      if error_code(e) not in CONFLICT_ERROR_CODES:
+        raise e
+      logger.info("State store entry changed concurrently, dropping it: %s" % sanitize_log(self.prefix + key))
+      self.delete(key)
+
+  def get_many(self, keys, default=None):
+    keys = list(dict.fromkeys(keys))
+    if len(keys) <= 1:
+      return {key: self.get(key, default) for key in keys}
+    with ThreadPoolExecutor(max_workers=min(S3_STORE_CONCURRENCY, len(keys))) as executor:
+      return dict(zip(keys, executor.map(lambda key: self.get(key, default), keys)))
+
+  def put_many(self, items):
+    items = list(items)
+    if len(items) <= 1:
+      for key, value in items:
+        self.put(key, value)
+      return
+    with ThreadPoolExecutor(max_workers=min(S3_STORE_CONCURRENCY, len(items))) as executor:
+      list(executor.map(lambda item: self.put(*item), items))
+
+  def delete(self, key):
+    self.s3.delete_object(Bucket=self.bucket, Key=self.prefix + key)
+
+  def items(self):
+    entries = []
+    paginator = self.s3.get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=self.bucket, Prefix=self.prefix):
+      for entry in page.get('Contents', []):
+        key = entry['Key'][len(self.prefix):]
+        value = self.get(key)
+        if value is not None:
+          entries.append((key, value))
+    return entries
+
+  def expire(self):
+    pass
+
+  def refresh(self):
+    pass
+
+  def flush(self):
+    with self.lock:
+      self.etags = {}
+
+def create_memory_store(location, namespace, ttl):
+  return MemoryStore(ttl)
+
+def create_file_store(location, namespace, ttl):
+  return FileStore(os.path.join(location or DEFAULT_STATE_DIR, namespace + '.json'), ttl)
+
+def create_s3_store(location, namespace, ttl):
+  bucket, prefix = split_s3_bucket_key(location)
+  key = '%s/%s.json' % (prefix.rstrip('/'), namespace) if prefix else namespace + '.json'
+  return S3Store(bucket, key, ttl)
+
+def create_s3_prefix_store(location, namespace, ttl):
+  bucket, prefix = split_s3_bucket_key(location)
+  prefix = '%s/%s/' % (prefix.rstrip('/'), namespace) if prefix else namespace + '/'
+  return S3PrefixStore(bucket, prefix, ttl)
+
+# Store factories by URI scheme, additional backends can be registered here
+STORE_TYPES = {
+  'memory': create_memory_store,
+  'file': create_file_store,
+  's3': create_s3_store,
+  's3prefix': create_s3_prefix_store
+}
+
+stores = {}
+
+def parse_store_uri(uri):
+  if not uri:
+    return 'file', DEFAULT_STATE_DIR
+  if '://' not in uri:
+    return (uri, '') if uri in STORE_TYPES else ('file', uri)
+  return tuple(uri.split('://', 1))
+
+def get_state_store(namespace, ttl=None, uri=None):
+  """Returns the state store for the namespace, cached for the lifetime of the container and refreshed from shared storage
+  every time it is fetched. The backend is chosen by the scheme of uri (SF_STATE_STORE_URI by default), a JSON file in /tmp
+  when none is configured."""
+  if namespace not in stores:
+    scheme, location = parse_store_uri(STATE_STORE_URI if uri is None else uri)
+    logger.info("Using %s state store for %s" % (scheme, sanitize_log(namespace)))
+    stores[namespace] = STORE_TYPES[scheme](location, namespace, ttl)
+  else:
+    stores[namespace].refresh()
+  return stores[namespace]
+
+def error_code(e):
+  return str(e.response.get('Error', {}).get('Code'))
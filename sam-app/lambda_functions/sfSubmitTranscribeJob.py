@@ -25,10 +25,14 @@ limitations under the License.
 
 import boto3
 import json
-import datetime
 import os
-from log_util import logger
+import time
+from botocore.exceptions import ClientError
+from log_util import logger, sanitize_log
+from sf_util import split_s3_bucket_key
+from sfTranscribeUtil import get_transcription_job, find_transcription_job, format_transcription_job, estimate_completion_seconds, schedule_next_poll, MEDIA_BYTES_PER_SECOND
 client = boto3.client('transcribe')
+s3 = boto3.client('s3')
 
 def lambda_handler(event, context):
     try:
@@ -42,6 +46,28 @@ def lambda_handler(event, context):
 
         logger.info('OutputBucketName: ' + transcriptDestination + ' > jobName: ' + job_name)
 
+        # Job names are derived from the contact and its recording, a replayed contact finds the job of the first run
+        job = find_transcription_job(job_name, transcriptDestination, language_code)
+        if job and job["TranscriptionJobStatus"] == "FAILED":
+            logger.info('Resubmitting failed transcription job %s: %s' % (sanitize_log(job_name), sanitize_log(str(job.get("FailureReason")))))
+            client.delete_transcription_job(TranscriptionJobName=job_name)
+            job = None
+        if job:
+            logger.info('Reusing transcription job %s in status %s' % (sanitize_log(job_name), job["TranscriptionJobStatus"]))
+        else:
+            job = start_transcription_job(job_name, language_code, media_format, file_uri, transcriptDestination, settings)
+
+        schedule = {'SubmittedAt': time.time(), 'MaxPollSeconds': int(event.get("wait_time", 20))}
+        media_duration = event.get("mediaDurationSeconds") or get_media_duration(file_uri, media_format)
+        if media_duration:
+            schedule['MediaDurationSeconds'] = media_duration
+            schedule['ExpectedCompletionSeconds'] = estimate_completion_seconds(media_duration)
+        return schedule_next_poll(job, schedule)
+    except Exception as e:
+        raise(e)
+
+def start_transcription_job(job_name, language_code, media_format, file_uri, transcriptDestination, settings):
+    try:
         response = client.start_transcription_job(
             TranscriptionJobName=job_name,
             LanguageCode=language_code,
@@ -53,16 +79,21 @@ def lambda_handler(event, context):
             #OutputEncryptionKMSKeyId = outputEncryptionKMSKeyId,
             Settings = settings
         )
-        # BELOW IS THE CODE TO FIX SERIALIZATION ON DATETIME OBJECTS
-        if "CreationTime" in response["TranscriptionJob"]:
-            val = response["TranscriptionJob"]["CreationTime"]
-            response["TranscriptionJob"]["CreationTime"] = val.strftime("%Y-%m-%dT%H:%M:%S.%f%z") if isinstance(val, datetime.datetime) else str(val)
-        if "StartTime" in response["TranscriptionJob"]:
-            val = response["TranscriptionJob"]["StartTime"]
-            response["TranscriptionJob"]["StartTime"] = val.strftime("%Y-%m-%dT%H:%M:%S.%f%z") if isinstance(val, datetime.datetime) else str(val)
-        if "CompletionTime" in response["TranscriptionJob"]:
-            val = response["TranscriptionJob"]["CompletionTime"]
-            response["TranscriptionJob"]["CompletionTime"] = val.strftime("%Y-%m-%dT%H:%M:%S.%f%z") if isinstance(val, datetime.datetime) else str(val)
-        return response["TranscriptionJob"]
-    except Exception as e:
-        raise(e)
+        return format_transcription_job(response["TranscriptionJob"])
+    except ClientError as e:
+        # Another execution submitted the same job in the meantime
+        if e.response['Error']['Code'] != 'ConflictException':
+            raise e
+        logger.info('Transcription job %s already submitted' % sanitize_log(job_name))
+        return get_transcription_job(job_name)
+
+def get_media_duration(file_uri, media_format):
+    """Estimates the duration of a wav recording from its size, returns None when it cannot be estimated."""
+    if media_format != 'wav':
+        return None
+    try:
+        bucket, key = split_s3_bucket_key(file_uri.replace('https://s3.amazonaws.com/', '', 1))
+        return int(s3.head_object(Bucket=bucket, Key=key)['ContentLength'] / MEDIA_BYTES_PER_SECOND)
+    except ClientError as e:
+        logger.warning('Could not estimate the duration of %s: %s' % (sanitize_log(file_uri), sanitize_log(str(e))))
+        return None
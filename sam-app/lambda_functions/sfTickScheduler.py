@@ -0,0 +1,95 @@
+"""
+You must have an AWS account to use the Amazon Connect CTI Adapter.
+Downloading and/or using the Amazon Connect CTI Adapter is subject to the terms of the AWS Customer Agreement,
+AWS Service Terms, and AWS Privacy Notice.
+
+© 2017, Amazon Web Services, Inc. or its affiliates. All rights reserved.
+
+NOTE:  Other license terms may apply to certain, identified software components
+contained within or distributed with the Amazon Connect CTI Adapter if such terms are
+included in the LibPhoneNumber-js and Salesforce Open CTI. For such identified components,
+such other license terms will then apply in lieu of the terms above.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import math, os, time
+from datetime import datetime, timezone
+from log_util import logger
+
+# Milliseconds of the invocation kept free after the last tick
+TICK_BUFFER_MILLIS = int(os.environ.get('TICK_BUFFER_MILLIS', '5000'))
+
+# Start of the last tick run by this container, by name
+last_ticks = {}
+
+def is_scheduled_event(event):
+  return isinstance(event, dict) and event.get('detail-type') == 'Scheduled Event'
+
+def scheduled_time(event):
+  """Returns the time the schedule fired the event at, in seconds since the epoch, or None when it has none."""
+  try:
+    return datetime.strptime(event['time'], '%Y-%m-%dT%H:%M:%SZ').replace(tzinfo=timezone.utc).timestamp()
+  except (KeyError, TypeError, ValueError):
+    return None
+
+def run_ticks(tick, interval, period, context, buffer_millis=TICK_BUFFER_MILLIS, scheduled_at=None):
+  """Runs tick every interval seconds for one period of the schedule that invoked the function, for example 4 ticks of 15 seconds
+  per rate(1 minute) invocation. The slots are the multiples of interval within the period the invocation was scheduled in, taken
+  from scheduled_at or else the current time, so the first slot of the next invocation always follows the last slot of this one.
+  Each sleep targets the absolute start of the next slot, so time spent in a tick does not accumulate as drift. Slots missed by a
+  late invocation or a slow tick are skipped, and no tick is started unless it is expected to finish buffer_millis before the
+  function times out. A failing tick does not cancel the remaining ticks, the first error is raised once the period is over.
+  Returns the number of ticks run."""
+  base = math.floor((time.time() if scheduled_at is None else scheduled_at) / period) * period
+  slots = max(1, int(round(period / interval)))
+  if time.time() >= base + slots * interval:
+    logger.warning("Invoked after the end of its schedule period, skipping its ticks")
+    return 0
+  ticks = 0
+  longest = 0
+  error = None
+  # A late invocation starts with the current slot
+  slot = max(0, int((time.time() - base) // interval))
+  while slot < slots:
+    wait = max(0, base + slot * interval - time.time())
+    if context is not None and context.get_remaining_time_in_millis() - wait * 1000 - longest * 1000 < buffer_millis:
+      logger.info("Stopping after %d ticks, not enough time left for another" % ticks)
+      break
+    time.sleep(wait)
+
+    started = time.time()
+    try:
+      tick()
+    except Exception as e:
+      logger.error("Tick %d failed: %s" % (slot, str(e)))
+      error = error or e
+    ticks = ticks + 1
+    longest = max(longest, time.time() - started)
+
+    next_slot = int((time.time() - base) // interval) + 1
+    if next_slot > slot + 1:
+      logger.warning("Tick %d took %.1f seconds, skipping %d slots" % (slot, time.time() - started, next_slot - slot - 1))
+    slot = next_slot
+
+  if error is not None:
+    raise error
+  return ticks
+
+def follows_previous_tick(name, interval):
+  """Records the start of a tick of name and returns whether this container also ran the previous one, interval seconds ago.
+  State kept in the container is only current when it did, otherwise another container may have run the ticks in between."""
+  now = time.time()
+  previous = last_ticks.get(name)
+  last_ticks[name] = now
+  return previous is not None and now - previous <= interval * 1.5
@@ -0,0 +1,45 @@
+"""
+You must have an AWS account to use the Amazon Connect CTI Adapter.
+Downloading and/or using the Amazon Connect CTI Adapter is subject to the terms of the AWS Customer Agreement,
+AWS Service Terms, and AWS Privacy Notice.
+
+© 2017, Amazon Web Services, Inc. or its affiliates. All rights reserved.
+
+NOTE:  Other license terms may apply to certain, identified software components
+contained within or distributed with the Amazon Connect CTI Adapter if such terms are
+included in the LibPhoneNumber-js and Salesforce Open CTI. For such identified components,
+such other license terms will then apply in lieu of the terms above.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+from log_util import logger, sanitize_log
+from sfTranscribeUtil import get_transcription_job, load_task_token, complete_task, FINAL_STATUSES
+
+
+def lambda_handler(event, context):
+    """Handles Transcribe Job State Change events, resuming the sfTranscribeStateMachine execution waiting on the job."""
+    detail = event["detail"]
+    job_name = detail["TranscriptionJobName"]
+    status = detail["TranscriptionJobStatus"]
+    logger.info('Transcription job %s is %s' % (sanitize_log(job_name), sanitize_log(status)))
+    if status not in FINAL_STATUSES:
+        return
+
+    task_token = load_task_token(job_name)
+    if task_token is None:
+        # Jobs started elsewhere, or executions that already fell back to polling
+        logger.info('No execution waiting on %s' % sanitize_log(job_name))
+        return
+
+    complete_task(job_name, get_transcription_job(job_name), task_token)
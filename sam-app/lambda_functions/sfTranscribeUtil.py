@@ -0,0 +1,137 @@
+"""
+You must have an AWS account to use the Amazon Connect CTI Adapter.
+Downloading and/or using the Amazon Connect CTI Adapter is subject to the terms of the AWS Customer Agreement,
+AWS Service Terms, and AWS Privacy Notice.
+
+© 2017, Amazon Web Services, Inc. or its affiliates. All rights reserved.
+
+NOTE:  Other license terms may apply to certain, identified software components
+contained within or distributed with the Amazon Connect CTI Adapter if such terms are
+included in the LibPhoneNumber-js and Salesforce Open CTI. For such identified components,
+such other license terms will then apply in lieu of the terms above.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import boto3
+import json
+import datetime
+import os
+import time
+from botocore.exceptions import ClientError
+from log_util import logger, sanitize_log
+
+transcribe = boto3.client('transcribe')
+s3 = boto3.client('s3')
+stepfunctions = boto3.client('stepfunctions')
+
+# Task tokens of executions waiting on a transcription job are kept next to the transcripts, one object per job
+TASK_TOKEN_BUCKET = os.environ.get('TRANSCRIPTS_DESTINATION', '')
+TASK_TOKEN_PREFIX = 'transcribe-task-tokens/'
+FINAL_STATUSES = ('COMPLETED', 'FAILED')
+
+# Seconds Transcribe needs per second of media plus a fixed overhead, used to predict when a job finishes
+TRANSCRIBE_SECONDS_PER_MEDIA_SECOND = float(os.environ.get('TRANSCRIBE_SECONDS_PER_MEDIA_SECOND', '0.3'))
+TRANSCRIBE_OVERHEAD_SECONDS = float(os.environ.get('TRANSCRIBE_OVERHEAD_SECONDS', '20'))
+MIN_POLL_SECONDS = int(os.environ.get('TRANSCRIBE_MIN_POLL_SECONDS', '5'))
+# Connect call recordings are 8 kHz 16 bit stereo wav files
+MEDIA_BYTES_PER_SECOND = int(os.environ.get('MEDIA_BYTES_PER_SECOND', '32000'))
+# Fields added to the job by sfSubmitTranscribeJob and carried through every status check
+SCHEDULE_FIELDS = ('MediaDurationSeconds', 'ExpectedCompletionSeconds', 'SubmittedAt', 'MaxPollSeconds')
+
+def get_transcription_job(job_name):
+    response = transcribe.get_transcription_job(TranscriptionJobName=job_name)
+    return format_transcription_job(response["TranscriptionJob"])
+
+def find_transcription_job(job_name, transcript_bucket, language_code):
+    """Returns the job named job_name, or a completed job pointing at its transcript when the job is gone but its transcript
+    is still in transcript_bucket, or None when the job was never run."""
+    try:
+        return get_transcription_job(job_name)
+    except ClientError as e:
+        # Transcribe reports unknown jobs as a bad request
+        if e.response['Error']['Code'] != 'BadRequestException':
+            raise e
+    key = job_name + '.json'
+    try:
+        s3.head_object(Bucket=transcript_bucket, Key=key)
+    except ClientError as e:
+        if e.response['Error']['Code'] in ('NoSuchKey', '404', 'AccessDenied', '403'):
+            return None
+        raise e
+    return {
+        'TranscriptionJobName': job_name,
+        'TranscriptionJobStatus': 'COMPLETED',
+        'LanguageCode': language_code,
+        'Transcript': {'TranscriptFileUri': 'https://s3.%s.amazonaws.com/%s/%s' % (s3.meta.region_name, transcript_bucket, key)}
+    }
+
+def format_transcription_job(job):
+    # Datetimes are not JSON serializable, format them so the job can be passed between states
+    for field in ("CreationTime", "StartTime", "CompletionTime"):
+        if field in job:
+            val = job[field]
+            job[field] = val.strftime("%Y-%m-%dT%H:%M:%S.%f%z") if isinstance(val, datetime.datetime) else str(val)
+    return job
+
+def estimate_completion_seconds(media_duration):
+    return int(TRANSCRIBE_OVERHEAD_SECONDS + media_duration * TRANSCRIBE_SECONDS_PER_MEDIA_SECOND)
+
+def schedule_next_poll(job, schedule):
+    """Sets NextPollSeconds on the job from the schedule fields of the submitted job. The first wait lasts until the job is
+    expected to finish, later polls come every tenth of the expected time, between MIN_POLL_SECONDS and MaxPollSeconds.
+    Jobs without a duration estimate are polled every MaxPollSeconds."""
+    for field in SCHEDULE_FIELDS:
+        if field in schedule:
+            job[field] = schedule[field]
+    max_poll = int(schedule['MaxPollSeconds'])
+    if 'ExpectedCompletionSeconds' not in schedule:
+        job['NextPollSeconds'] = max_poll
+        return job
+
+    expected = schedule['ExpectedCompletionSeconds']
+    remaining = expected - (time.time() - schedule['SubmittedAt'])
+    if remaining > MIN_POLL_SECONDS:
+        job['NextPollSeconds'] = int(remaining)
+    else:
+        job['NextPollSeconds'] = int(max(MIN_POLL_SECONDS, min(max_poll, expected * 0.1)))
+    return job
+
+def task_token_key(job_name):
+    return TASK_TOKEN_PREFIX + job_name + '.json'
+
+def save_task_token(job_name, task_token):
+    s3.put_object(Bucket=TASK_TOKEN_BUCKET, Key=task_token_key(job_name), Body=json.dumps({'taskToken': task_token}), ContentType='application/json')
+
+def load_task_token(job_name):
+    try:
+        return json.loads(s3.get_object(Bucket=TASK_TOKEN_BUCKET, Key=task_token_key(job_name))['Body'].read())['taskToken']
+    except ClientError as e:
+        if e.response['Error']['Code'] in ('NoSuchKey', '404', 'AccessDenied', '403'):
+            return None
+        raise e
+
+def delete_task_token(job_name):
+    s3.delete_object(Bucket=TASK_TOKEN_BUCKET, Key=task_token_key(job_name))
+
+def complete_task(job_name, job, task_token):
+    """Resumes the execution waiting on the job with the job as task output and forgets its token.
+    Both the job state change event and the check made when the token is registered may complete the task, the second call is ignored."""
+    try:
+        stepfunctions.send_task_success(taskToken=task_token, output=json.dumps(job))
+        logger.info('Resumed execution waiting on %s' % sanitize_log(job_name))
+    except ClientError as e:
+        if e.response['Error']['Code'] not in ('TaskTimedOut', 'InvalidToken', 'TaskDoesNotExist'):
+            raise e
+        logger.info('Execution waiting on %s already resumed: %s' % (sanitize_log(job_name), e.response['Error']['Code']))
+    delete_task_token(job_name)
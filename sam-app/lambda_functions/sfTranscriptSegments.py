@@ -0,0 +1,59 @@
+"""
+You must have an AWS account to use the Amazon Connect CTI Adapter.
+Downloading and/or using the Amazon Connect CTI Adapter is subject to the terms of the AWS Customer Agreement,
+AWS Service Terms, and AWS Privacy Notice.
+
+© 2017, Amazon Web Services, Inc. or its affiliates. All rights reserved.
+
+NOTE:  Other license terms may apply to certain, identified software components
+contained within or distributed with the Amazon Connect CTI Adapter if such terms are
+included in the LibPhoneNumber-js and Salesforce Open CTI. For such identified components,
+such other license terms will then apply in lieu of the terms above.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import json
+from array import array
+
+class TranscriptSegments:
+    """Segments of one Transcribe channel kept as columns: start and end times in arrays, contents in a single string
+    sliced by offsets."""
+
+    __slots__ = ('start_times', 'end_times', 'offsets', 'text')
+
+    def __init__(self, start_times=None, end_times=None, contents=()):
+        self.start_times = start_times if start_times is not None else array('d')
+        self.end_times = end_times if end_times is not None else array('d')
+        self.offsets = array('q', [0])
+        offset = 0
+        for content in contents:
+            offset += len(content)
+            self.offsets.append(offset)
+        self.text = ''.join(contents)
+
+    def __len__(self):
+        return len(self.start_times)
+
+    def content(self, index):
+        return self.text[self.offsets[index]:self.offsets[index + 1]]
+
+    def contents(self):
+        return [self.content(index) for index in range(len(self))]
+
+    def records(self):
+        for index in range(len(self)):
+            yield {'start_time': self.start_times[index], 'end_time': self.end_times[index], 'content': self.content(index)}
+
+    def to_json(self):
+        return json.dumps(list(self.records()))
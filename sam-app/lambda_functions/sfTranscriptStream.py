@@ -0,0 +1,184 @@
+"""
+You must have an AWS account to use the Amazon Connect CTI Adapter.
+Downloading and/or using the Amazon Connect CTI Adapter is subject to the terms of the AWS Customer Agreement,
+AWS Service Terms, and AWS Privacy Notice.
+
+© 2017, Amazon Web Services, Inc. or its affiliates. All rights reserved.
+
+NOTE:  Other license terms may apply to certain, identified software components
+contained within or distributed with the Amazon Connect CTI Adapter if such terms are
+included in the LibPhoneNumber-js and Salesforce Open CTI. For such identified components,
+such other license terms will then apply in lieu of the terms above.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import codecs
+import json
+import re
+
+# Bytes read from the stream at a time
+READ_SIZE = 64 * 1024
+WHITESPACE = re.compile(r'[ \t\n\r]*')
+# Characters that matter while skipping a value, inside and outside of strings
+STRING_SPECIAL = re.compile(r'["\\]')
+STRUCTURE_SPECIAL = re.compile(r'["{}\[\]]')
+
+class JSONStreamReader:
+    """Reads a JSON document from a file-like object without loading it whole. Only the values asked for with
+    read_value are decoded, everything else is skipped, and consumed text is dropped from the buffer."""
+
+    def __init__(self, stream, read_size=READ_SIZE):
+        self.stream = stream
+        self.read_size = read_size
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+        self.utf8 = codecs.getincrementaldecoder('utf-8')()
+        self.decoder = json.JSONDecoder()
+
+    def fill(self):
+        if self.eof:
+            return False
+        data = self.stream.read(self.read_size)
+        if not data:
+            self.eof = True
+            return False
+        if isinstance(data, bytes):
+            # a multi-byte character split between reads is completed by the next read
+            data = self.utf8.decode(data)
+        self.buffer = self.buffer[self.pos:] + data
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """Returns the next character that is not whitespace, without consuming it."""
+        while True:
+            self.pos = WHITESPACE.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self.fill():
+                raise ValueError('Unexpected end of JSON document')
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise ValueError('Expected %r at %r' % (char, self.buffer[self.pos:self.pos + 20]))
+        self.pos += 1
+
+    def read_value(self):
+        """Decodes the next value. Values are decoded from the buffer, which grows until the value is complete."""
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+            except ValueError:
+                if not self.fill():
+                    raise
+                continue
+            # a number may continue in the next read
+            if end == len(self.buffer) and not self.eof and self.buffer[self.pos] not in '{["':
+                self.fill()
+                continue
+            self.pos = end
+            return value
+
+    def skip_value(self):
+        """Consumes the next value without decoding it."""
+        if self.peek() not in '{["':
+            self.read_value()
+            return
+        depth = 0
+        in_string = False
+        while True:
+            pattern = STRING_SPECIAL if in_string else STRUCTURE_SPECIAL
+            match = pattern.search(self.buffer, self.pos)
+            if match is None:
+                self.pos = len(self.buffer)
+                if not self.fill():
+                    raise ValueError('Unexpected end of JSON document')
+                continue
+            char = match.group()
+            if char == '\\':
+                if match.end() >= len(self.buffer):
+                    # read the escaped character before moving past the escape
+                    self.pos = match.start()
+                    if not self.fill():
+                        raise ValueError('Unexpected end of JSON document')
+                    continue
+                self.pos = match.end() + 1
+                continue
+            self.pos = match.end()
+            if char == '"':
+                in_string = not in_string
+                if not in_string and depth == 0:
+                    return
+            elif char in '{[':
+                depth += 1
+            else:
+                depth -= 1
+                if depth == 0:
+                    return
+
+    def iter_object(self):
+        """Iterates over the keys of the next object, each value must be read or skipped before the next key."""
+        self.expect('{')
+        if self.peek() == '}':
+            self.pos += 1
+            return
+        while True:
+            key = self.read_value()
+            self.expect(':')
+            yield key
+            if self.peek() == ',':
+                self.pos += 1
+                continue
+            self.expect('}')
+            return
+
+    def iter_array(self):
+        """Iterates over the positions of the next array, each element must be read or skipped before the next one."""
+        self.expect('[')
+        if self.peek() == ']':
+            self.pos += 1
+            return
+        index = 0
+        while True:
+            yield index
+            index += 1
+            if self.peek() == ',':
+                self.pos += 1
+                continue
+            self.expect(']')
+            return
+
+def find_key(reader, key):
+    """Moves the reader to the value of key in the next object, skipping the other keys."""
+    for name in reader.iter_object():
+        if name == key:
+            return True
+        reader.skip_value()
+    return False
+
+def iter_channel_items(stream):
+    """Yields (channel index, item) for the items of results.channel_labels.channels of a Transcribe output,
+    channel by channel, reading the document from the stream."""
+    reader = JSONStreamReader(stream)
+    if not find_key(reader, 'results') or not find_key(reader, 'channel_labels') or not find_key(reader, 'channels'):
+        raise ValueError('Transcript has no channel_labels, channel identification must be enabled')
+    for channel_index in reader.iter_array():
+        for key in reader.iter_object():
+            if key != 'items':
+                reader.skip_value()
+                continue
+            for _ in reader.iter_array():
+                yield channel_index, reader.read_value()
@@ -29,8 +29,20 @@ import json
 import boto3
 from botocore.exceptions import ClientError
 import os
+import random
+import time
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
 from log_util import logger, sanitize_log
 
+# Number of S3 objects processed concurrently by the S3 triggered functions
+S3_OBJECT_CONCURRENCY = int(os.environ.get('S3_OBJECT_CONCURRENCY', '4'))
+# Error codes returned by AWS APIs when the caller exceeds its request rate
+THROTTLING_ERROR_CODES = ('TooManyRequestsException', 'ThrottlingException', 'Throttling', 'RequestLimitExceeded')
+THROTTLING_MAX_ATTEMPTS = int(os.environ.get('THROTTLING_MAX_ATTEMPTS', '6'))
+# invoke calls the sfInvokeAPI Lambda for every Salesforce request, direct calls Salesforce from the calling function
+SF_INVOKE_API_MODE = os.environ.get('SF_INVOKE_API_MODE', 'invoke')
+
 def parse_date(value, date=datetime.now()):
     if type(value) is not str:
         return value
@@ -109,20 +121,74 @@ def find_bucket_key(s3_path):
         s3_key = '/'.join(s3_components[1:])
     return bucket, s3_key
 
-def getS3FileMetadata(Bucket, ContactId):
-    oMetadata = {}
-    s3 = boto3.client('s3')
+def get_s3_event_objects(event):
+    """Returns bucket, key and event time for every S3 record in the event.
+    S3 notifications delivered through SQS are unwrapped, so queue batching can be used, each object keeps the messageId
+    of the SQS message it came in.
+    """
+    s3_objects = []
+    for record in event.get('Records', []):
+        if 'body' in record:
+            for s3_object in get_s3_event_objects(json.loads(record['body'])):
+                s3_objects.append(dict(s3_object, messageId=record['messageId']))
+        elif 's3' in record:
+            s3_objects.append({
+                'bucket': record['s3']['bucket']['name'],
+                'key': urllib.parse.unquote(record['s3']['object']['key']),
+                'eventTime': record.get('eventTime')
+            })
+    return s3_objects
+
+def process_s3_objects(s3_objects, process, max_workers=S3_OBJECT_CONCURRENCY):
+    """Calls process(s3_object) for every object, at most max_workers at a time.
+    Returns one result per object with its status, a failure never stops the other objects.
+    """
+    def run(s3_object):
+        try:
+            return dict(s3_object, status='SUCCEEDED', result=process(s3_object))
+        except Exception as e:
+            logger.error('Failed to process s3://%s/%s: %s' % (sanitize_log(s3_object['bucket']), sanitize_log(s3_object['key']), sanitize_log(str(e))))
+            return dict(s3_object, status='FAILED', error=str(e))
+
+    if len(s3_objects) <= 1:
+        return [run(s3_object) for s3_object in s3_objects]
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(s3_objects))) as executor:
+        return list(executor.map(run, s3_objects))
 
-    try:
-        response = s3.head_object(Bucket=Bucket, Key='locks/' + ContactId + '.lock')
-        logger.info('GetS3FileMetadata Response: %s ' % sanitize_log(str(response)))
-        if 'Metadata' in response:
-            oMetadata = response['Metadata']
-    except ClientError as e:
-        logger.warning('ClientError on response: %s ' % sanitize_log(str(e)))
-        return oMetadata
+def check_s3_results(results):
+    """Returns the batch response for the results, so only failed objects are delivered again.
+    Objects from SQS messages are reported as batchItemFailures, which needs ReportBatchItemFailures on the event source
+    mapping. Direct S3 invocations fail only when no object succeeded, retrying the invocation would repeat the others.
+    """
+    for result in results:
+        logger.info('s3://%s/%s: %s' % (sanitize_log(result['bucket']), sanitize_log(result['key']), result['status']))
+    failed = [result for result in results if result['status'] == 'FAILED']
+    if any('messageId' in result for result in results):
+        message_ids = list(dict.fromkeys(result['messageId'] for result in failed))
+        return {'batchItemFailures': [{'itemIdentifier': message_id} for message_id in message_ids]}
+    if failed and len(failed) == len(results):
+        raise Exception('Failed to process %d of %d objects' % (len(failed), len(results)))
+    return {}
+
+def call_with_backoff(operation, max_attempts=THROTTLING_MAX_ATTEMPTS, base_delay=0.2, max_delay=5.0, **kwargs):
+    """Returns operation(**kwargs), throttled calls are retried with exponential backoff and full jitter
+    so concurrent callers do not retry in lockstep.
+    """
+    attempt = 1
+    while True:
+        try:
+            return operation(**kwargs)
+        except ClientError as e:
+            if e.response['Error']['Code'] not in THROTTLING_ERROR_CODES or attempt >= max_attempts:
+                raise e
+            delay = random.uniform(0, min(max_delay, base_delay * 2 ** attempt))
+            logger.info('%s throttled, retrying in %.2f seconds' % (getattr(operation, '__name__', 'Call'), delay))
+            time.sleep(delay)
+            attempt = attempt + 1
 
-    return oMetadata
+def getS3FileStream(bucket, key):
+    s3 = boto3.client('s3')
+    return s3.get_object(Bucket=bucket, Key=key)['Body']
 
 def getS3FileJSONObject(bucket, key):
     s3=boto3.resource('s3')
@@ -144,6 +210,14 @@ def attachFileSaleforceObject(objName, objContentType, objDescription, objParent
     return invokeSfAPI(sfRequest)
 
 def invokeSfAPI(sfRequest):
+    if SF_INVOKE_API_MODE == 'direct':
+        # same operations as the sfInvokeAPI Lambda, run in this process with the container's Salesforce client
+        from salesforce import get_salesforce
+        from sfInvokeAPI import invoke
+        response = invoke(get_salesforce(), sfRequest)
+        logger.info('SF API Response %s' % sanitize_log(str(response)))
+        return response
+
     sfLambdaClient = boto3.client('lambda')
 
     sfLambdaResponse = sfLambdaClient.invoke(FunctionName = os.environ['SFDC_INVOKE_API_LAMBDA'], InvocationType='RequestResponse', Payload=json.dumps(sfRequest))